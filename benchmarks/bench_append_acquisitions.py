@@ -0,0 +1,47 @@
+"""Compare per-readout cost of Dataset.append_acquisition against append_acquisitions."""
+import argparse
+import os
+
+import ismrmrd
+
+from bench_common import create_acquisitions, temporary_directory, Timer, report
+
+
+def append_one_by_one(filename, acquisitions):
+    with ismrmrd.Dataset(filename, mode='w') as dataset:
+        for acquisition in acquisitions:
+            dataset.append_acquisition(acquisition)
+
+
+def append_in_batches(filename, acquisitions, batch_size):
+    with ismrmrd.Dataset(filename, mode='w') as dataset:
+        for start in range(0, len(acquisitions), batch_size):
+            dataset.append_acquisitions(acquisitions[start:start + batch_size])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--readouts', type=int, default=10000)
+    parser.add_argument('-c', '--channels', type=int, default=16)
+    parser.add_argument('-s', '--samples', type=int, default=256)
+    parser.add_argument('-b', '--batch-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    acquisitions = create_acquisitions(args.readouts, nchannels=args.channels, nsamples=args.samples)
+
+    with temporary_directory() as directory:
+        with Timer() as timer:
+            append_one_by_one(os.path.join(directory, 'loop.h5'), acquisitions)
+        report('append_acquisition (loop)', timer.elapsed, args.readouts)
+
+        with Timer() as timer:
+            append_in_batches(os.path.join(directory, 'batch.h5'), acquisitions, args.batch_size)
+        report(f'append_acquisitions (batch={args.batch_size})', timer.elapsed, args.readouts)
+
+        with Timer() as timer:
+            append_in_batches(os.path.join(directory, 'single.h5'), acquisitions, args.readouts)
+        report('append_acquisitions (single batch)', timer.elapsed, args.readouts)
+
+
+if __name__ == '__main__':
+    main()
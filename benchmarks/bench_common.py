@@ -0,0 +1,89 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+import ismrmrd
+
+
+def create_acquisition(index, nchannels=16, nsamples=256, trajectory_dimensions=0):
+    """Create a synthetic Cartesian readout for benchmarking."""
+    rng = np.random.default_rng(index)
+    data = (rng.standard_normal((nchannels, nsamples)) +
+            1j * rng.standard_normal((nchannels, nsamples))).astype(np.complex64)
+    trajectory = rng.standard_normal((nsamples, trajectory_dimensions)).astype(np.float32)
+
+    acquisition = ismrmrd.Acquisition.from_array(data, trajectory)
+    acquisition.scan_counter = index
+    acquisition.idx.kspace_encode_step_1 = index % 256
+    acquisition.idx.slice = (index // 256) % 4
+    acquisition.idx.repetition = index // 1024
+    return acquisition
+
+
+def create_acquisitions(count, **kwargs):
+    return [create_acquisition(i, **kwargs) for i in range(count)]
+
+
+def create_kspace(nchannels=16, ny=256, nx=256, noise=1e-3, seed=0):
+    """Create multi-coil k-space of a disc phantom, shaped (channels, ny, nx).
+
+    Unlike white noise, this compresses roughly like real k-space does.
+    """
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[-1:1:ny * 1j, -1:1:nx * 1j]
+    image = (x ** 2 + y ** 2 < 0.6).astype(np.float32)
+
+    angles = np.linspace(0, 2 * np.pi, nchannels, endpoint=False)
+    sensitivities = np.exp(-((x[None] - 0.8 * np.cos(angles)[:, None, None]) ** 2 +
+                             (y[None] - 0.8 * np.sin(angles)[:, None, None]) ** 2))
+
+    kspace = np.fft.fftshift(np.fft.fft2(image[None] * sensitivities), axes=(-2, -1))
+    kspace += noise * np.abs(kspace).max() * (rng.standard_normal(kspace.shape) +
+                                              1j * rng.standard_normal(kspace.shape))
+    return kspace.astype(np.complex64)
+
+
+def create_cartesian_acquisitions(nchannels=16, ny=256, nx=256, nrepetitions=1):
+    """Split synthetic k-space into one acquisition per phase-encoding line."""
+    kspace = create_kspace(nchannels, ny, nx)
+
+    acquisitions = []
+    for repetition in range(nrepetitions):
+        for line in range(ny):
+            acquisition = ismrmrd.Acquisition.from_array(np.ascontiguousarray(kspace[:, line, :]))
+            acquisition.scan_counter = len(acquisitions)
+            acquisition.idx.kspace_encode_step_1 = line
+            acquisition.idx.repetition = repetition
+            acquisitions.append(acquisition)
+    return acquisitions
+
+
+@contextlib.contextmanager
+def temporary_directory():
+    directory = tempfile.mkdtemp(prefix='ismrmrd-python-', suffix='-bench')
+    try:
+        yield directory
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+class Timer:
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def file_size(filename):
+    return os.path.getsize(filename)
+
+
+def report(label, elapsed, count, unit='readout'):
+    print(f"{label:<40} {elapsed:8.3f} s  {1e6 * elapsed / max(count, 1):10.2f} us/{unit}")
@@ -0,0 +1,79 @@
+"""Write-read cycle of an ISMRMRD File through each HDF5 driver, page buffering and alignment."""
+import argparse
+import io
+import os
+
+import ismrmrd
+
+from bench_common import create_acquisition, temporary_directory, Timer, file_size
+
+
+def acquisitions(count, nchannels, nsamples):
+    # Reuse a few readouts, so that generating them does not dominate the timings.
+    templates = [create_acquisition(i, nchannels=nchannels, nsamples=nsamples) for i in range(16)]
+    for index in range(count):
+        yield templates[index % len(templates)]
+
+
+def configurations(directory, page_buf_size, alignment):
+    path = os.path.join(directory, 'drivers.h5')
+    yield 'stdio (default)', path, {}
+    yield 'sec2', path, {'driver': 'sec2'}
+    yield 'sec2 + page buffer', path, {'driver': 'sec2', 'page_buf_size': page_buf_size}
+    yield 'sec2 + alignment', path, {'driver': 'sec2', 'alignment': alignment}
+    yield 'core, backing store', path, {'driver': 'core', 'backing_store': True}
+    yield 'core, in memory', path, {'driver': 'core', 'backing_store': False}
+    yield 'fileobj (BytesIO)', None, {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size', type=int, default=1024, help="Amount of acquisition data in MiB")
+    parser.add_argument('-c', '--channels', type=int, default=32)
+    parser.add_argument('-s', '--samples', type=int, default=512)
+    parser.add_argument('--block', type=int, default=1024, help="Acquisitions per batch read")
+    parser.add_argument('--page-buf-size', type=int, default=64 << 20)
+    parser.add_argument('--alignment', type=int, nargs=2, default=[1 << 20, 1 << 20], metavar=('THRESHOLD', 'INTERVAL'))
+    args = parser.parse_args()
+
+    readout_nbytes = 8 * args.channels * args.samples
+    count = max(1, (args.size << 20) // readout_nbytes)
+    mib = count * readout_nbytes / 1024 ** 2
+    print(f"{count} acquisitions, {mib:.0f} MiB of data")
+    print(f"{'configuration':<24} {'write':>8} {'read':>8} {'write MiB/s':>12} {'read MiB/s':>12} {'size MiB':>10}")
+
+    with temporary_directory() as directory:
+        for label, path, options in configurations(directory, args.page_buf_size, tuple(args.alignment)):
+            target = path if path is not None else io.BytesIO()
+
+            with Timer() as write:
+                with ismrmrd.File(target, 'w', **options) as file:
+                    file['dataset'].acquisitions = acquisitions(count, args.channels, args.samples)
+
+            if options.get('backing_store') is False:
+                # Nothing to reopen; read back from a fresh in-memory file instead.
+                reader = ismrmrd.File(target, 'w', **options)
+                reader['dataset'].acquisitions = acquisitions(count, args.channels, args.samples)
+            else:
+                read_options = {key: value for key, value in options.items() if key != 'backing_store'}
+                reader = ismrmrd.File(target, 'r', **read_options)
+
+            with Timer() as read:
+                with reader as file:
+                    records = file['dataset'].acquisitions
+                    for start in range(0, len(records), args.block):
+                        records.batch[start:start + args.block]
+
+            if isinstance(target, io.BytesIO):
+                size = len(target.getbuffer())
+            else:
+                size = file_size(target) if os.path.exists(target) else 0
+            print(f"{label:<24} {write.elapsed:8.2f} {read.elapsed:8.2f} {mib / write.elapsed:12.1f} "
+                  f"{mib / read.elapsed:12.1f} {size / 1024 ** 2:10.1f}")
+
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Dataset.map_acquisitions throughput against a serial read, including worker start-up and pickling costs."""
+import argparse
+import os
+
+import numpy as np
+
+import ismrmrd
+
+from bench_common import create_acquisitions, temporary_directory, Timer, report
+
+
+def nothing(batch):
+    return None
+
+
+def reconstruct(batch):
+    # Per-readout FFT and root-sum-of-squares coil combination; returns a
+    # small result, so that little has to be pickled back to the parent.
+    return np.sqrt((np.abs(np.fft.fft(batch.data, axis=-1)) ** 2).sum(axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--readouts', type=int, default=20000)
+    parser.add_argument('-c', '--channels', type=int, default=32)
+    parser.add_argument('-s', '--samples', type=int, default=512)
+    parser.add_argument('-p', '--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--shard-size', type=int, default=None)
+    args = parser.parse_args()
+
+    with temporary_directory() as directory:
+        filename = os.path.join(directory, 'parallel_read.h5')
+
+        with ismrmrd.Dataset(filename, mode='w') as dataset:
+            for start in range(0, args.readouts, 1024):
+                count = min(1024, args.readouts - start)
+                dataset.append_acquisitions(create_acquisitions(count, nchannels=args.channels,
+                                                                nsamples=args.samples))
+
+        with ismrmrd.Dataset(filename, mode='r') as dataset:
+            with Timer() as timer:
+                batch = dataset.read_acquisitions(batch=True)
+            report('serial read', timer.elapsed, args.readouts)
+
+            with Timer() as timer:
+                reconstruct(dataset.read_acquisitions(batch=True))
+            report('serial read + reconstruct', timer.elapsed, args.readouts)
+            del batch
+
+            for processes in args.processes:
+                # Dominated by process start-up and imports in the workers.
+                with Timer() as timer:
+                    next(dataset.map_acquisitions(nothing, processes=processes, shard_size=args.shard_size))
+                print(f"{f'{processes} processes, first result':<40} {timer.elapsed:8.3f} s")
+
+                with Timer() as timer:
+                    for _ in dataset.map_acquisitions(processes=processes, shard_size=args.shard_size):
+                        pass
+                report(f'{processes} processes, batches pickled back', timer.elapsed, args.readouts)
+
+                with Timer() as timer:
+                    list(dataset.map_acquisitions(reconstruct, processes=processes, shard_size=args.shard_size))
+                report(f'{processes} processes, reconstruct', timer.elapsed, args.readouts)
+
+                with Timer() as timer:
+                    list(dataset.map_acquisitions(reconstruct, processes=processes, shard_size=args.shard_size,
+                                                  ordered=False))
+                report(f'{processes} processes, reconstruct unordered', timer.elapsed, args.readouts)
+
+
+if __name__ == '__main__':
+    main()
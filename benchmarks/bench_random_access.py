@@ -0,0 +1,51 @@
+"""Random-access Dataset.read_acquisition throughput for several chunk cache sizes."""
+import argparse
+import os
+
+import h5py
+import numpy as np
+
+import ismrmrd
+
+from bench_common import create_acquisitions, temporary_directory, Timer, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--readouts', type=int, default=20000)
+    parser.add_argument('-c', '--channels', type=int, default=32)
+    parser.add_argument('-s', '--samples', type=int, default=512)
+    parser.add_argument('-r', '--reads', type=int, default=5000)
+    parser.add_argument('--chunks', type=int, default=64)
+    args = parser.parse_args()
+
+    order = np.random.default_rng(0).integers(0, args.readouts, args.reads)
+
+    with temporary_directory() as directory:
+        filename = os.path.join(directory, 'random_access.h5')
+
+        with ismrmrd.Dataset(filename, mode='w', storage={'chunks': args.chunks}) as dataset:
+            for start in range(0, args.readouts, 1024):
+                count = min(1024, args.readouts - start)
+                dataset.append_acquisitions(create_acquisitions(count, nchannels=args.channels,
+                                                                nsamples=args.samples))
+
+        # Baseline: path lookups through h5py on every read, as Dataset used to do.
+        with h5py.File(filename, 'r') as file:
+            with Timer() as timer:
+                for i in order:
+                    if 'dataset' in file and 'data' in file['dataset']:
+                        file['dataset']['data'][i]
+        report('h5py with per-read path lookups', timer.elapsed, args.reads, unit='read')
+
+        for nbytes in [None, 16 * 1024 ** 2, 256 * 1024 ** 2]:
+            with ismrmrd.Dataset(filename, mode='r', rdcc_nbytes=nbytes, rdcc_nslots=10007) as dataset:
+                with Timer() as timer:
+                    for i in order:
+                        dataset.read_acquisition(i)
+            label = 'default' if nbytes is None else f'{nbytes // 1024 ** 2} MiB'
+            report(f'read_acquisition (cache {label})', timer.elapsed, args.reads, unit='read')
+
+
+if __name__ == '__main__':
+    main()
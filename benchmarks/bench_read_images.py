@@ -0,0 +1,75 @@
+"""Reading an image series through file.Images: per-image, sliced and into a reused buffer."""
+import argparse
+import os
+
+import numpy as np
+
+import ismrmrd
+
+from bench_common import temporary_directory, Timer, report
+
+
+def create_images(count, nx, ny, nz, dtype):
+    rng = np.random.default_rng(0)
+    data = rng.standard_normal((nz, ny, nx)).astype(dtype)
+    for index in range(count):
+        image = ismrmrd.Image.from_array(data + index)
+        image.image_index = index
+        yield image
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--images', type=int, default=2000)
+    parser.add_argument('-x', '--matrix', type=int, default=256)
+    parser.add_argument('-z', '--partitions', type=int, default=1)
+    parser.add_argument('--dtype', default='complex64', choices=['float32', 'complex64'])
+    parser.add_argument('-b', '--block', type=int, default=100, help="Images per slice read")
+    args = parser.parse_args()
+
+    shape = (1, args.partitions, args.matrix, args.matrix)
+    nbytes = args.images * np.dtype(args.dtype).itemsize * int(np.prod(shape))
+    print(f"{args.images} images of {shape}, {nbytes / 1024 ** 2:.1f} MiB")
+
+    with temporary_directory() as directory:
+        filename = os.path.join(directory, 'images.h5')
+
+        with ismrmrd.File(filename, 'w') as file:
+            with Timer() as timer:
+                file['dataset/images'].images = create_images(args.images, args.matrix, args.matrix,
+                                                              args.partitions, args.dtype)
+        report('write (streamed assignment)', timer.elapsed, args.images, unit='image')
+
+        with ismrmrd.File(filename, 'r') as file:
+            images = file['dataset/images'].images
+
+            # Baseline: an Image allocating its own buffer, filled with astype, as Images used to do.
+            with Timer() as timer:
+                for i in range(len(images)):
+                    image = ismrmrd.Image(images.headers[i], images.attributes[i].decode('ascii'))
+                    image.data[:] = images.data[i].astype(image.data.dtype)
+            report('per image, copied into a new Image', timer.elapsed, args.images, unit='image')
+
+            with Timer() as timer:
+                for image in images:
+                    pass
+            report('iteration (adopted arrays)', timer.elapsed, args.images, unit='image')
+
+            with Timer() as timer:
+                for start in range(0, len(images), args.block):
+                    images[start:start + args.block]
+            report(f'slices of {args.block} images', timer.elapsed, args.images, unit='image')
+
+            out = np.empty((args.block,) + shape, dtype=args.dtype)
+            with Timer() as timer:
+                for start in range(0, len(images) - args.block + 1, args.block):
+                    images.read_data(slice(start, start + args.block), out=out)
+            report('read_data into a reused buffer', timer.elapsed, args.images, unit='image')
+
+            with Timer() as timer:
+                images.read_data()
+            report('read_data of the whole series', timer.elapsed, args.images, unit='image')
+
+
+if __name__ == '__main__':
+    main()
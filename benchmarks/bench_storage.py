@@ -0,0 +1,57 @@
+"""Write throughput, read throughput and file size for a matrix of storage options."""
+import argparse
+import itertools
+import os
+
+import ismrmrd
+
+from bench_common import create_cartesian_acquisitions, temporary_directory, Timer, file_size
+
+settings = {
+    'default': None,
+    'chunks=64': {'chunks': 64},
+    'chunks=1024': {'chunks': 1024},
+    'gzip=1': {'chunks': 256, 'compression': 'gzip', 'compression_opts': 1},
+    'gzip=4+shuffle': {'chunks': 256, 'compression': 'gzip', 'compression_opts': 4, 'shuffle': True},
+    'lzf': {'chunks': 256, 'compression': 'lzf'},
+    'lzf+shuffle': {'chunks': 256, 'compression': 'lzf', 'shuffle': True},
+    'lzf+shuffle+fletcher32': {'chunks': 256, 'compression': 'lzf', 'shuffle': True, 'fletcher32': True},
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-c', '--channels', type=int, default=16)
+    parser.add_argument('-y', '--lines', type=int, default=256)
+    parser.add_argument('-x', '--samples', type=int, default=256)
+    parser.add_argument('-r', '--repetitions', type=int, default=4)
+    parser.add_argument('-b', '--batch-size', type=int, default=256)
+    parser.add_argument('-l', '--layout', choices=['vlen', 'dense'], nargs='+', default=['vlen', 'dense'])
+    args = parser.parse_args()
+
+    acquisitions = create_cartesian_acquisitions(args.channels, args.lines, args.samples, args.repetitions)
+    megabytes = sum(acq.data.nbytes + acq.traj.nbytes for acq in acquisitions) / 1e6
+
+    print(f"{len(acquisitions)} readouts, {megabytes:.1f} MB of samples")
+    print(f"{'layout':<6} {'storage':<26} {'write MB/s':>10} {'read MB/s':>10} {'size MB':>10} {'ratio':>7}")
+
+    with temporary_directory() as directory:
+        for layout, (name, storage) in itertools.product(args.layout, settings.items()):
+            filename = os.path.join(directory, layout + '-' + name + '.h5')
+
+            with Timer() as write:
+                with ismrmrd.Dataset(filename, mode='w', storage=storage, layout=layout) as dataset:
+                    for start in range(0, len(acquisitions), args.batch_size):
+                        dataset.append_acquisitions(acquisitions[start:start + args.batch_size])
+
+            with Timer() as read:
+                with ismrmrd.Dataset(filename, mode='r') as dataset:
+                    dataset.read_acquisitions()
+
+            size = file_size(filename) / 1e6
+            print(f"{layout:<6} {name:<26} {megabytes / write.elapsed:10.1f} {megabytes / read.elapsed:10.1f} "
+                  f"{size:10.1f} {megabytes / size:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,9 @@ except _PackageNotFoundError:
 
 from .constants import *
 from .acquisition import AcquisitionHeader, Acquisition, EncodingCounters
+from .batch import AcquisitionBatch
+from .index import EncodingIndex
+from .instrumentation import IOStats
 from .util import sign_of_directions, directions_to_quaternion, quaternion_to_directions
 from .image import ImageHeader, Image
 from .hdf5 import Dataset
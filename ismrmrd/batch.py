@@ -0,0 +1,79 @@
+import numpy as np
+
+from .acquisition import Acquisition
+
+
+def _uniform_shape(headers):
+    # (active_channels, number_of_samples, trajectory_dimensions) shared by
+    # every acquisition header, or None if the shapes differ.
+    shapes = np.unique(np.stack([headers['active_channels'],
+                                 headers['number_of_samples'],
+                                 headers['trajectory_dimensions']], axis=-1), axis=0)
+    if len(shapes) != 1:
+        return None
+    return tuple(int(n) for n in shapes[0])
+
+
+class AcquisitionBatch:
+    """A columnar batch of acquisitions.
+
+    Headers are kept as a structured array of ``acquisition_header_dtype``.
+    When every acquisition in the batch has the same shape, ``data`` is a
+    single ``(N, active_channels, number_of_samples)`` complex64 array and
+    ``traj`` a single ``(N, number_of_samples, trajectory_dimensions)``
+    float32 array. Otherwise the batch is ragged and ``data`` and ``traj`` are
+    lists holding one array per acquisition.
+
+    Individual :class:`Acquisition` objects are only created on demand, by
+    indexing or iterating the batch.
+    """
+
+    def __init__(self, headers, data, traj):
+        self.headers = headers
+        self.data = data
+        self.traj = traj
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from an array of ``acquisition_dtype`` records."""
+        headers = records['head']
+
+        data = [raw.view(np.complex64) for raw in records['data']]
+        traj = list(records['traj'])
+
+        shape = _uniform_shape(headers)
+
+        if shape is not None:
+            nchannels, nsamples, ndimensions = shape
+            data = np.concatenate(data).reshape((len(records), nchannels, nsamples))
+            traj = np.concatenate(traj).reshape((len(records), nsamples, ndimensions))
+        else:
+            data = [d.reshape((h['active_channels'], h['number_of_samples']))
+                    for d, h in zip(data, headers)]
+            traj = [t.reshape((h['number_of_samples'], h['trajectory_dimensions']))
+                    for t, h in zip(traj, headers)]
+
+        return cls(headers, data, traj)
+
+    @property
+    def is_ragged(self):
+        return not isinstance(self.data, np.ndarray)
+
+    def __len__(self):
+        return self.headers.size
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return AcquisitionBatch(self.headers[key], self.data[key], self.traj[key])
+        return Acquisition(self.headers[key], self.data[key], self.traj[key])
+
+    def to_acquisitions(self):
+        return list(self)
+
+    def __repr__(self):
+        layout = 'ragged' if self.is_ragged else 'stacked'
+        return f"{type(self).__name__} containing {len(self)} {layout} acquisitions"
@@ -1,38 +1,128 @@
+import copy
+import itertools
+import os
+
 import h5py
 import numpy as np
 
 from .hdf5 import acquisition_header_dtype, acquisition_dtype, waveform_header_dtype, waveform_dtype, image_header_dtype
-from .acquisition import Acquisition
+from .hdf5 import _read_acquisition_headers, _storage_kwargs, _length, _index, length_attribute
+from .hdf5 import dense_datasets, _acquisitions_to_dense, _dense_matches, _create_dense, _write_dense, _read_dense
+from .hdf5 import _read_selection, _dense_to_vlen, index_dataset, _encoding_index, _drop_encoding_index
+from .hdf5 import _read_blocks, _memory_dtype
+from .flags import _match_flags
+from .instrumentation import Instrumentation, disabled, instrumented
+from .acquisition import Acquisition, AcquisitionHeader
+from .batch import AcquisitionBatch
 from .waveform import Waveform
-from .image import Image
+from .image import Image, get_dtype_from_data_type
 from .xsd import ToXML, CreateFromDocument
 
 
+def _key(key, length):
+    # Datasets appended by hdf5.Dataset may be over-allocated; keep indices
+    # within the rows actually in use.
+    if isinstance(key, slice):
+        return slice(*key.indices(length))
+    return _index(key, length)
+
+
+def _blocks(iterable, block_size):
+    # Consume an iterable as lists of at most block_size items, so that
+    # writes need memory for one block rather than for everything written.
+    iterator = iter(iterable)
+    while True:
+        block = list(itertools.islice(iterator, block_size))
+        if not block:
+            return
+        yield block
+
+
+def _resize(dset, size):
+    dset.resize(size, axis=0)
+    if length_attribute in dset.attrs:
+        del dset.attrs[length_attribute]
+
+
+def _is_selection(key):
+    # Slices, index arrays and boolean masks, as opposed to a single index.
+    return isinstance(key, slice) or np.ndim(key) > 0
+
+
+class _Batches:
+    # Indexed through the `batch` property of acquisitions; reads the
+    # selection as a single AcquisitionBatch.
+
+    def __init__(self, read):
+        self._read = read
+
+    def __getitem__(self, key):
+        return self._read(key)
+
+
+class _LazyAcquisition(Acquisition):
+    # An acquisition whose header is decoded from the record up front, and
+    # whose data and trajectory are read through `source` when first used.
+    # Acquisition keeps them in its name-mangled private attributes, so every
+    # method reaching for them, not just the properties, loads them.
+
+    _payload = ('_Acquisition__data', '_Acquisition__traj')
+
+    def __init__(self, head, source, row):
+        self._head = AcquisitionHeader.from_buffer_copy(head)
+        self._source = source
+        self._row = row
+
+    def __getattr__(self, name):
+        if name not in self._payload or '_source' not in self.__dict__:
+            raise AttributeError(name)
+        if not self._source._is_open():
+            raise ValueError("Cannot read the data of a lazy acquisition after its file was closed.")
+        data, traj = self._source._read_payload(self._row)
+        self._Acquisition__data, self._Acquisition__traj = data, traj
+        del self._source
+        return self.__dict__[name]
+
+    def __reduce__(self):
+        # Copied and pickled as a plain Acquisition, as the h5py source cannot be.
+        return Acquisition, (self._head, self.data, self.traj)
+
+
+def _lazy_acquisitions(source, block_size):
+    length = len(source)
+    for start in range(0, length, block_size):
+        headers = source.headers(slice(start, min(start + block_size, length)))
+        for row, head in enumerate(headers, start):
+            yield _LazyAcquisition(head, source, row)
+
+
 class DataWrapper:
 
     def __init__(self, data):
         self.data = data
 
     def __len__(self):
-        return self.data.size
+        return _length(self.data)
 
+    @instrumented('read_{}')
     def __iter__(self):
-        for raw in self.data:
-                yield self.from_numpy(raw)
+        for i in range(len(self)):
+                yield self.from_numpy(self.data[i])
 
+    @instrumented('read_{}')
     def __getitem__(self, key):
-        if isinstance(key, slice):
-            return [self.from_numpy(raw) for raw in self.data[key]]
-        else:
-            return self.from_numpy(self.data[key])
+        if _is_selection(key):
+            return [self.from_numpy(raw) for raw in _read_selection(self.data, key)]
+        return self.from_numpy(self.data[_key(key, len(self))])
 
+    @instrumented('write_{}', 1)
     def __setitem__(self, key, value):
         try:
             iterable = [self.to_numpy(v) for v in value]
         except TypeError:
             iterable = [self.to_numpy(value)]
 
-        self.data[key] = np.array(iterable, dtype=self.datatype)
+        self.data[_key(key, len(self))] = np.array(iterable, dtype=self.datatype)
 
     def __repr__(self):
         return type(self).__name__ + " containing " + self.data.__repr__()
@@ -40,12 +130,14 @@ class DataWrapper:
     def append(self,item):
         self.extend([item])
 
-    def extend(self,iterable):
-        new_data = [self.to_numpy(v) for v in iterable]
-        old_size = self.data.shape[0]
-        new_size = old_size + len(new_data)
-        self.data.resize(new_size,axis=0)
-        self.data[old_size:] = new_data
+    @instrumented('append_{}', 0)
+    def extend(self, iterable, block_size=256):
+        size = len(self)
+        for block in _blocks(iterable, block_size):
+            new_data = np.array([self.to_numpy(v) for v in block], dtype=self.datatype)
+            _resize(self.data, size + len(new_data))
+            self.data[size:] = new_data
+            size += len(new_data)
 
     @classmethod
     def from_numpy(cls, raw):
@@ -56,12 +148,83 @@ class DataWrapper:
         raise NotImplemented()
 
     datatype = None
+    _instrumentation = disabled
+    _item = None
 
 
 class Acquisitions(DataWrapper):
 
     def __init__(self, data):
         super().__init__(data)
+        self._index = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self._index = None
+        _drop_encoding_index(self.data.parent)
+
+    @property
+    def batch(self):
+        """Read acquisitions as an :class:`ismrmrd.AcquisitionBatch` by indexing.
+
+        ``acquisitions.batch[key]`` reads a slice, an index array or a
+        boolean mask of acquisitions with a single HDF5 read. Headers stay in
+        a structured array and data and trajectories are stacked, or kept as
+        ragged lists when shapes differ; :class:`ismrmrd.Acquisition` objects
+        are only created when the batch is indexed or iterated.
+        """
+        return _Batches(self._read_batch)
+
+    @instrumented('read_acquisition')
+    def _read_batch(self, selection):
+        return AcquisitionBatch.from_records(_read_selection(self.data, selection))
+
+    @instrumented('read_acquisition_header')
+    def headers(self, selection=None):
+        """Read acquisition headers as a structured array of ``acquisition_header_dtype``.
+
+        Only the ``head`` member of each record is read; data and trajectories
+        are left on disk. *selection* may be a slice, an index array or a
+        boolean mask.
+        """
+        return _read_acquisition_headers(self.data, selection)
+
+    def lazy(self, block_size=256):
+        """Iterate over acquisitions whose data and trajectory are read when first used.
+
+        Headers are read *block_size* at a time, without the payloads; the
+        data and trajectory of an acquisition are read when they are first
+        accessed, which must happen while the file is open. Suited to
+        passes that mostly look at header fields such as ``idx`` or
+        ``flags``.
+        """
+        return _lazy_acquisitions(self, block_size)
+
+    def _is_open(self):
+        return self.data.id.valid
+
+    @instrumented('read_acquisition')
+    def _read_payload(self, row):
+        raw = self.data[row]
+        head = raw['head']
+        return (raw['data'].view(np.complex64).reshape((head['active_channels'], head['number_of_samples'])),
+                raw['traj'].reshape((head['number_of_samples'], head['trajectory_dimensions'])))
+
+    def encoding_index(self, persist=False):
+        """Return an :class:`ismrmrd.EncodingIndex` of the acquisitions; see :meth:`ismrmrd.Dataset.encoding_index`."""
+        self._index = _encoding_index(self.data.parent, len(self), self.headers, self._index, persist)
+        return self._index
+
+    def find(self, **counters):
+        """Rows of the acquisitions with the given encoding counters, e.g. ``find(slice=3, repetition=7)``."""
+        return self.encoding_index().rows(**counters)
+
+    def select(self, flags_all=(), flags_none=(), decode=False):
+        """Select acquisitions by their header flags; see :meth:`ismrmrd.Dataset.select`."""
+        rows = np.flatnonzero(_match_flags(self.headers()['flags'], flags_all, flags_none))
+        if decode:
+            return _read_blocks(lambda block: map(self.from_numpy, _read_selection(self.data, block)), rows)
+        return rows
 
     @classmethod
     def from_numpy(cls, raw):
@@ -85,6 +248,178 @@ class Acquisitions(DataWrapper):
         )
 
     datatype = acquisition_dtype
+    _item = 'acquisition'
+
+
+class DenseAcquisitions:
+    """Acquisitions stored in the dense fixed-shape layout.
+
+    See the *layout* parameter of :class:`ismrmrd.Dataset`. Writing an
+    acquisition whose shape does not fit the layout moves all acquisitions of
+    the container to the regular vlen records first.
+    """
+
+    _instrumentation = disabled
+
+    def __init__(self, contents, storage=None):
+        self._contents = contents
+        self._storage = storage
+        self._index = None
+
+    def _datasets(self):
+        return tuple(self._contents.get(name) for name in dense_datasets)
+
+    def _vlen(self):
+        # Once moved to vlen records, defer to the regular wrapper.
+        if 'dense_head' in self._contents:
+            return None
+        return Acquisitions(self._contents['data'])
+
+    def _fallback(self):
+        _dense_to_vlen(self._contents, self._storage)
+        return self._vlen()
+
+    def __len__(self):
+        vlen = self._vlen()
+        if vlen is not None:
+            return len(vlen)
+        return _length(self._contents['dense_head'])
+
+    @instrumented('read_acquisition')
+    def __iter__(self, block_size=256):
+        vlen = self._vlen()
+        if vlen is not None:
+            yield from vlen
+            return
+
+        datasets = self._datasets()
+        for start in range(0, len(self), block_size):
+            yield from _read_dense(datasets, slice(start, start + block_size))
+
+    @instrumented('read_acquisition')
+    def __getitem__(self, key):
+        vlen = self._vlen()
+        if vlen is not None:
+            return vlen[key]
+
+        if _is_selection(key):
+            return _read_dense(self._datasets(), key).to_acquisitions()
+        return _read_dense(self._datasets(), [_key(key, len(self))])[0]
+
+    @property
+    def batch(self):
+        """Read acquisitions as an :class:`ismrmrd.AcquisitionBatch` by indexing; see :attr:`Acquisitions.batch`."""
+        return _Batches(self._read_batch)
+
+    @instrumented('read_acquisition')
+    def _read_batch(self, selection):
+        vlen = self._vlen()
+        if vlen is not None:
+            return vlen._read_batch(selection)
+        return _read_dense(self._datasets(), selection)
+
+    @instrumented('write_acquisition', 1)
+    def __setitem__(self, key, value):
+        self._index = None
+        _drop_encoding_index(self._contents)
+
+        vlen = self._vlen()
+        if vlen is not None:
+            vlen[key] = value
+            return
+
+        try:
+            acquisitions = list(value)
+        except TypeError:
+            acquisitions = [value]
+
+        headers, data, traj = _acquisitions_to_dense(acquisitions)
+        datasets = self._datasets()
+        if not _dense_matches(datasets, data, traj):
+            self._fallback()[key] = acquisitions
+            return
+
+        key = _key(key, len(self))
+        if not isinstance(key, slice):
+            key = slice(key, key + 1)
+        if len(range(*key.indices(len(self)))) != len(acquisitions):
+            raise TypeError("Number of acquisitions does not match the selection.")
+
+        _write_dense(datasets, key, headers, data, traj)
+
+    def __repr__(self):
+        return type(self).__name__ + " containing " + self._contents['dense_head'].__repr__()
+
+    def append(self, item):
+        self.extend([item])
+
+    @instrumented('append_acquisition', 0)
+    def extend(self, iterable, block_size=256):
+        vlen = self._vlen()
+        if vlen is not None:
+            vlen.extend(iterable, block_size)
+            return
+
+        datasets = self._datasets()
+        size = len(self)
+
+        blocks = _blocks(iterable, block_size)
+        for block in blocks:
+            headers, data, traj = _acquisitions_to_dense(block)
+            if not _dense_matches(datasets, data, traj):
+                self._fallback().extend(itertools.chain(block, itertools.chain.from_iterable(blocks)), block_size)
+                return
+
+            for dset in datasets:
+                if dset is not None:
+                    _resize(dset, size + len(block))
+
+            _write_dense(datasets, slice(size, size + len(block)), headers, data, traj)
+            size += len(block)
+
+    @instrumented('read_acquisition_header')
+    def headers(self, selection=None):
+        """Read acquisition headers as a structured array of ``acquisition_header_dtype``."""
+        vlen = self._vlen()
+        if vlen is not None:
+            return vlen.headers(selection)
+        return _read_selection(self._contents['dense_head'], selection).astype(acquisition_header_dtype, copy=False)
+
+    def lazy(self, block_size=256):
+        """Iterate over acquisitions whose data and trajectory are read when first used; see :meth:`Acquisitions.lazy`."""
+        return _lazy_acquisitions(self, block_size)
+
+    def _is_open(self):
+        return self._contents.id.valid
+
+    @instrumented('read_acquisition')
+    def _read_payload(self, row):
+        vlen = self._vlen()
+        if vlen is not None:
+            return vlen._read_payload(row)
+        batch = _read_dense(self._datasets(), [row])
+        return batch.data[0], batch.traj[0]
+
+    def encoding_index(self, persist=False):
+        """Return an :class:`ismrmrd.EncodingIndex` of the acquisitions; see :meth:`ismrmrd.Dataset.encoding_index`."""
+        self._index = _encoding_index(self._contents, len(self), self.headers, self._index, persist)
+        return self._index
+
+    def find(self, **counters):
+        """Rows of the acquisitions with the given encoding counters, e.g. ``find(slice=3, repetition=7)``."""
+        return self.encoding_index().rows(**counters)
+
+    def select(self, flags_all=(), flags_none=(), decode=False):
+        """Select acquisitions by their header flags; see :meth:`ismrmrd.Dataset.select`."""
+        vlen = self._vlen()
+        if vlen is not None:
+            return vlen.select(flags_all, flags_none, decode)
+
+        flags = _read_selection(self._contents['dense_head'], None, 'flags')
+        rows = np.flatnonzero(_match_flags(flags, flags_all, flags_none))
+        if decode:
+            return _read_blocks(lambda block: _read_dense(self._datasets(), block), rows)
+        return rows
 
 
 class Waveforms(DataWrapper):
@@ -117,6 +452,7 @@ class Waveforms(DataWrapper):
         )
 
     datatype = waveform_dtype
+    _item = 'waveform'
 
 
 class Images:
@@ -127,37 +463,109 @@ class Images:
         self.attributes = attributes
 
     def __len__(self):
-        return self.headers.size
+        return _length(self.headers)
 
-    def __iter__(self):
-        for data, header, attributes in zip(self.data, self.headers, self.attributes):
-            yield self.from_numpy(header, data, attributes)
+    @instrumented('read_image')
+    def __iter__(self, block_size=16):
+        length = len(self)
+        for start in range(0, length, block_size):
+            block = slice(start, min(start + block_size, length))
+            for raw in zip(self.headers[block], self.read_data(block), self.attributes[block]):
+                yield self.from_numpy(*raw)
 
+    @instrumented('read_image')
     def __getitem__(self, key):
+        key = _key(key, len(self))
         if isinstance(key, slice):
-            return [self.from_numpy(*raw) for raw in zip(self.headers[key], self.data[key], self.attributes[key])]
+            # one read for the data of every image; each image adopts a row
+            return [self.from_numpy(*raw) for raw in zip(self.headers[key], self.read_data(key), self.attributes[key])]
         else:
             return self.from_numpy(
                 self.headers[key],
-                self.data[key],
+                self.read_data(key)[0],
                 self.attributes[key]
             )
 
+    def read_data(self, key=slice(None), out=None):
+        """Read the data of an image or a slice of images with a single HDF5 read.
+
+        Parameters
+        ----------
+        key : int or slice, optional
+            Images to read; all images by default.
+        out : numpy.ndarray, optional
+            C-contiguous array of shape ``(images, channels, z, y, x)`` and
+            of the stored data type (complex for complex images) to read the
+            data into, e.g. a buffer reused across reads.
+
+        Returns
+        -------
+        numpy.ndarray
+            *out*, or a new array, holding the data of the images.
+        """
+        key = _key(key, len(self))
+        if not isinstance(key, slice):
+            key = slice(key, key + 1)
+
+        shape = (len(range(*key.indices(len(self)))),) + self.data.shape[1:]
+        dtype = _memory_dtype(self.data.dtype)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape or out.dtype != dtype or not out.flags.c_contiguous:
+            raise ValueError("Output buffer must be a C-contiguous %s array of shape %s." % (dtype, shape))
+
+        if shape[0]:
+            self.data.read_direct(out.view(self.data.dtype), source_sel=key)
+        return out
+
+    @instrumented('write_image', 1)
     def __setitem__(self, key, value):
         try:
             iterable = [self.to_numpy(v) for v in value]
         except TypeError:
             iterable = [self.to_numpy(value)]
 
+        key = _key(key, len(self))
         self.headers[key] = np.stack([header for header, _, __ in iterable])
         self.data[key] = np.stack([data for _, data, __ in iterable])
         self.attributes[key] = np.stack([attributes for _, __, attributes in iterable])
 
+    def append(self, image):
+        self.extend([image])
+
+    @instrumented('append_image', 0)
+    def extend(self, images, block_size=32):
+        """Append images, resizing the image datasets a block of images at a time.
+
+        Every image must have the shape and data type of the images already
+        stored.
+        """
+        size = len(self)
+        for block in _blocks(images, block_size):
+            headers, data, attributes = self._stack(block)
+            if data.shape[1:] != self.data.shape[1:] or data.dtype != _memory_dtype(self.data.dtype):
+                raise TypeError("Images do not match the shape and data type of the stored images.")
+
+            for dset in (self.headers, self.data, self.attributes):
+                _resize(dset, size + len(block))
+
+            rows = slice(size, size + len(block))
+            self.headers[rows] = headers.reshape((len(block),) + self.headers.shape[1:])
+            self.data[rows] = data.view(self.data.dtype)
+            self.attributes[rows] = attributes
+            size += len(block)
+
+    @classmethod
+    def _stack(cls, images):
+        headers, data, attributes = zip(*(cls.to_numpy(image) for image in images))
+        return np.stack(headers), np.stack(data), np.array(attributes, dtype=h5py.special_dtype(vlen=bytes))
+
     @classmethod
     def from_numpy(cls, header, data, attributes):
-        image = Image(header, attributes.decode('ascii', 'strict'))
-        image.data[:] = data.astype(image.data.dtype)
-        return image
+        # The image adopts the array read from the file, which is only
+        # converted if it is stored with another type than the header gives.
+        dtype = get_dtype_from_data_type(np.asarray(header['data_type']).item())
+        return Image(header, attributes.decode('ascii', 'strict'), data=data.astype(dtype, copy=False))
 
     @classmethod
     def to_numpy(cls, image):
@@ -168,23 +576,79 @@ class Images:
         return header, data, attributes
 
     datatype = None
+    _instrumentation = disabled
+
+
+# Group in which Container assignments write the datasets that replace the
+# existing ones.
+staging_group = 'ismrmrd_staging'
+
+
+def _classify(group):
+    # Paths, relative to group, of the groups below it holding images and
+    # acquisitions or waveforms, found by their member datasets in a single
+    # pass over the file. Like Group.visititems, but the object info tells
+    # datasets apart without opening every object.
+    members = {}
+
+    def collect(name, info):
+        if info.type == h5py.h5o.TYPE_DATASET:
+            parent, _, dataset = name.decode('utf-8').rpartition('/')
+            members.setdefault(parent, set()).add(dataset)
+
+    h5py.h5o.visit(group.id, collect, info=True)
+    members.pop('', None)
+
+    images, data = set(), set()
+    for path, names in members.items():
+        has_images = {'header', 'data', 'attributes'} <= names
+        if has_images:
+            images.add(path)
+        if ('data' in names and not has_images) or 'dense_head' in names or 'waveforms' in names:
+            data.add(path)
+
+    return frozenset(images), frozenset(data)
+
+
+class _Cache:
+    # Kept by a File for every folder and container obtained from it, by HDF5
+    # group name: the groups found by find_images() and find_data(), and the
+    # parsed XML headers.
+
+    def __init__(self):
+        self.groups = {}
+        self.headers = {}
 
 
 class Folder:
-    def __init__(self, contents):
+    def __init__(self, contents, storage=None, layout='vlen', instrumentation=disabled, cache=None):
         self._contents = contents
+        self.storage = storage
+        self.layout = layout
+        self._instrumentation = instrumentation
+        self._cache = cache
+
+    def _child(self, contents):
+        return Container(contents, self.storage, self.layout, self._instrumentation, self._cache)
+
+    def _invalidate(self, headers=False):
+        if self._cache is not None:
+            self._cache.groups.clear()
+            if headers:
+                self._cache.headers.clear()
 
     def __getitem__(self, key):
         if key in self._contents:
-            return Container(self._contents[key])
+            return self._child(self._contents[key])
         return self.__missing__(key)
 
     def __delitem__(self, key):
         if key in self._contents:
             del self._contents[key]
+            self._invalidate(headers=True)
 
     def __missing__(self, key):
-        return Container(self._contents.require_group(key))
+        return self._child(self._contents.require_group(key))
 
     def __contains__(self, key):
         return key in self._contents
@@ -210,27 +674,28 @@ class Folder:
             child = self[key]
             child.__visit(callback, key)
 
-    def find_images(self):
+    def _discover(self):
+        # Cached by the File, per group, until the next write through it
+        if self._cache is None:
+            return _classify(self._contents)
 
-        images = set()
+        name = self._contents.name
+        if name not in self._cache.groups:
+            self._cache.groups[name] = _classify(self._contents)
+        return self._cache.groups[name]
 
-        def find_images(node, path):
-            if node.has_images():
-                images.add(path)
+    def find_images(self):
+        """Return the paths of the groups below this one that hold images.
 
-        self.visit(find_images)
-        return images
+        Groups are found in a single pass over the file. The result is cached
+        by the :class:`File` until data is written or deleted through it;
+        changes made through other handles are not noticed.
+        """
+        return set(self._discover()[0])
 
     def find_data(self):
-
-        data = set()
-
-        def find_data(node, path):
-            if node.has_acquisitions() or node.has_waveforms():
-                data.add(path)
-
-        self.visit(find_data)
-        return data
+        """Return the paths of the groups below this one that hold acquisitions or waveforms."""
+        return set(self._discover()[1])
 
     def keys(self):
         return self._contents.keys()
@@ -238,28 +703,71 @@ class Folder:
 
 class Container(Folder):
 
-    def __init__(self, contents):
-        super(Container, self).__init__(contents)
+    def __init__(self, contents, storage=None, layout='vlen', instrumentation=disabled, cache=None):
+        super(Container, self).__init__(contents, storage, layout, instrumentation, cache)
+
+    def _instrument(self, wrapper):
+        wrapper._instrumentation = self._instrumentation
+        return wrapper
+
+    def _create_dataset(self, name, data, storage=None):
+        storage = self.storage if storage is None else storage
+        return self._contents.create_dataset(name, data=data, maxshape=(None,) + data.shape[1:],
+                                             **_storage_kwargs(storage, data.shape, data.dtype))
 
     def __get_acquisitions(self):
         if not self.has_acquisitions():
             return None
+        if 'dense_head' in self._contents:
+            return self._instrument(DenseAcquisitions(self._contents, self.storage))
         data = self._contents.get('data')
-        return Acquisitions(data)
+        return self._instrument(Acquisitions(data))
 
+    def _replace(self, delete, write):
+        # Write new datasets into a staging group and move them in place once
+        # written, so that the datasets replaced survive errors and can still
+        # be read by the iterable being written.
+        if staging_group in self._contents:
+            del self._contents[staging_group]
+
+        staging = Container(self._contents.create_group(staging_group), self.storage, self.layout)
+        try:
+            write(staging)
+            delete()
+            for name in list(staging.keys()):
+                self._contents.move(staging_group + '/' + name, name)
+        finally:
+            del self._contents[staging_group]
+            self._invalidate()
+
+    def _write_acquisitions(self, acquisitions, block_size=256):
+        acquisitions = iter(acquisitions)
+
+        if self.layout == 'dense':
+            first = list(itertools.islice(acquisitions, block_size))
+            headers, data, traj = _acquisitions_to_dense(first)
+            if data is not None:
+                _create_dense(self._contents, headers, data, traj, self.storage)
+                DenseAcquisitions(self._contents, self.storage).extend(acquisitions, block_size)
+                return
+            acquisitions = itertools.chain(first, acquisitions)
+
+        data = self._create_dataset('data', np.empty((0,), dtype=acquisition_dtype))
+        Acquisitions(data).extend(acquisitions, block_size)
+
+    @instrumented('write_acquisition', 0)
     def __set_acquisitions(self, acquisitions):
 
         if self.has_images():
             raise TypeError("Cannot add acquisitions when images are present.")
 
-        buffer = np.array([Acquisitions.to_numpy(a) for a in acquisitions], dtype=acquisition_dtype)
-
-        self.__del_acquisitions()
-        self._contents.create_dataset('data',data=buffer,maxshape=(None,),chunks=True)
+        self._replace(self.__del_acquisitions, lambda staging: staging._write_acquisitions(acquisitions))
 
     def __del_acquisitions(self):
-        if 'data' in self._contents:
-            del self._contents['data']
+        for key in ('data', index_dataset) + dense_datasets:
+            if key in self._contents:
+                del self._contents[key]
+        self._invalidate()
 
     acquisitions = property(__get_acquisitions, __set_acquisitions, __del_acquisitions)
 
@@ -267,22 +775,24 @@ class Container(Folder):
         if not self.has_waveforms():
             return None
         data = self._contents.get('waveforms')
-        return Waveforms(data)
+        return self._instrument(Waveforms(data))
 
+    @instrumented('write_waveform', 0)
     def __set_waveforms(self, waveforms):
 
         if self.has_images():
             raise TypeError("Cannot add waveforms when images are present.")
 
-        converter = Waveforms(None)
-        buffer = np.array([converter.to_numpy(w) for w in waveforms], dtype=waveform_dtype)
+        def write(staging):
+            data = staging._create_dataset('waveforms', np.empty((0,), dtype=waveform_dtype))
+            Waveforms(data).extend(waveforms)
 
-        self.__del_waveforms()
-        self._contents.create_dataset('waveforms', data=buffer, maxshape=(None,),chunks=True)
+        self._replace(self.__del_waveforms, write)
 
     def __del_waveforms(self):
         if 'waveforms' in self._contents:
             del self._contents['waveforms']
+        self._invalidate()
 
     waveforms = property(__get_waveforms, __set_waveforms, __del_waveforms)
 
@@ -290,49 +800,80 @@ class Container(Folder):
         if not self.has_images():
             return None
 
-        return Images(
+        return self._instrument(Images(
             self._contents.get('data'),
             self._contents.get('header'),
             self._contents.get('attributes')
-        )
+        ))
 
+    @instrumented('write_image', 0)
     def __set_images(self, images):
 
         if self.has_data():
             raise TypeError("Cannot add images when data is present.")
 
-        images = list(images)
+        self._replace(self.__del_images, lambda staging: staging._write_images(images))
+
+    def _write_images(self, images, block_size=32):
+        images = iter(images)
+
+        first = list(itertools.islice(images, block_size))
+        if not first:
+            raise ValueError("Cannot create image datasets without images.")
+        headers, data, attributes = Images._stack(first)
 
-        data = np.stack([image.data for image in images])
-        headers = np.stack([np.frombuffer(image.getHead(), dtype=image_header_dtype) for image in images])
-        attributes = np.stack([image.attribute_string for image in images])
+        # One image per chunk unless chosen otherwise, so that reading an
+        # image reads a single chunk
+        storage = dict(self.storage or {})
+        if storage.get('chunks') is None:
+            storage['chunks'] = 1
 
-        self.__del_images()
-        self._contents.create_dataset('data', data=data)
-        self._contents.create_dataset('header', data=headers)
-        self._contents.create_dataset('attributes', shape=attributes.shape, dtype=h5py.special_dtype(vlen=bytes))
-        self._contents['attributes'][:] = attributes
+        self._create_dataset('data', data, storage)
+        self._create_dataset('header', headers)
+        self._create_dataset('attributes', attributes)
+
+        self.images.extend(images, block_size)
 
     def __del_images(self):
         for key in ['header', 'data', 'attributes']:
             if key in self._contents:
                 del self._contents[key]
+        self._invalidate()
 
     images = property(__get_images, __set_images, __del_images)
 
+    @instrumented('read_header')
+    def _read_header(self):
+        return self._contents['xml'][0]
+
+    @instrumented('write_header', 0)
+    def _write_header(self, xml):
+        self.__del_header()
+        self._contents.create_dataset('xml', shape=(1,), dtype=h5py.special_dtype(vlen=bytes))
+        self._contents['xml'][0] = xml
+
     def __get_header(self):
+        # Parsed once per group while the File is open. Callers get a copy of
+        # the cached parse, which they may modify without affecting others.
+        if self._cache is not None and self._contents.name in self._cache.headers:
+            return copy.deepcopy(self._cache.headers[self._contents.name])
+
         if not self.has_header():
             return None
-        return CreateFromDocument(self._contents['xml'][0])
+
+        header = CreateFromDocument(self._read_header())
+        if self._cache is not None:
+            self._cache.headers[self._contents.name] = copy.deepcopy(header)
+        return header
 
     def __set_header(self, header):
-        self.__del_header()
-        self._contents.create_dataset('xml', shape=(1,), dtype=h5py.special_dtype(vlen=bytes))
-        self._contents['xml'][0] = ToXML(header)
+        self._write_header(ToXML(header))
 
     def __del_header(self):
         if 'xml' in self._contents:
             del self._contents['xml']
+        if self._cache is not None:
+            self._cache.headers.pop(self._contents.name, None)
 
     header = property(__get_header, __set_header, __del_header)
 
@@ -369,18 +910,21 @@ class Container(Folder):
         return 'waveforms' in self._contents
 
     def has_acquisitions(self):
-        return 'data' in self._contents and not self.has_images()
+        return ('data' in self._contents and not self.has_images()) or 'dense_head' in self._contents
 
 
 class File(Folder):
 
-    def __init__(self, filename, mode='a'):
+    def __init__(self, filename, mode='a', storage=None, layout='vlen', swmr=False, instrument=False,
+                 driver=None, backing_store=None, page_buf_size=None, page_size=4096, alignment=None):
         """Open an ISMRMRD File.
 
         Parameters
         ----------
-        filename : str
-            Path to the HDF5 file.
+        filename : str or file-like object
+            Path to the HDF5 file, or a Python file object opened in binary
+            mode, such as an :class:`io.BytesIO`, accessed through the h5py
+            ``fileobj`` driver.
         mode : str, optional
             h5py file-open mode.  Defaults to ``'a'`` (read/write, create if
             needed).  Pass ``'r'`` for read-only access without touching the
@@ -388,9 +932,125 @@ class File(Folder):
             :func:`h5py.File`: ``'r'``, ``'r+'``, ``'w'``, ``'w-'``/``'x'``,
             and ``'a'``.  See
             https://docs.h5py.org/en/stable/high/file.html for details.
+        storage : dict, optional
+            Storage options (chunking and filters) for every dataset written
+            through this file; see :class:`ismrmrd.Dataset` for the
+            recognised keys. The options are inherited by the containers
+            obtained from the file, and can be changed for a single container
+            by assigning to its ``storage`` attribute before writing.
+        layout : str, optional
+            Layout used when assigning acquisitions, ``'vlen'`` (default) or
+            ``'dense'``; see :class:`ismrmrd.Dataset`. Both layouts are read
+            transparently.
+        swmr : bool, optional
+            Use HDF5 single-writer/multiple-reader mode. With ``mode='r'``
+            the file is opened as a SWMR reader and :meth:`refresh` picks up
+            rows appended by the writer. In other modes the file is opened
+            with the latest HDF5 file format, and :meth:`start_swmr_write`
+            starts SWMR writing once every dataset the writer appends to has
+            been created. SWMR files are accessed through the default HDF5
+            file driver.
+        instrument : bool or callable, optional
+            Record I/O statistics from the start; see :meth:`instrument`. A
+            callable is used as its callback.
+        driver : str, optional
+            HDF5 file driver for files given by path: ``'stdio'`` (the
+            default, except in SWMR mode), ``'sec2'`` (the HDF5 default,
+            usually faster for large reads and writes) or ``'core'`` (the
+            whole file is kept in memory). See
+            https://docs.h5py.org/en/stable/high/file.html#file-drivers.
+        backing_store : bool, optional
+            With the ``'core'`` driver, whether the file is written to
+            *filename* when it is closed; pass False for a temporary
+            in-memory file.
+        page_buf_size : int, optional
+            Size in bytes of the HDF5 page buffer, a multiple of *page_size*.
+            Page buffering only applies to files created with paged file
+            space management, which files created by this call are.
+        page_size : int, optional
+            File space page size of files created with *page_buf_size*.
+        alignment : (int, int), optional
+            ``(threshold, interval)``: objects of at least *threshold* bytes
+            are aligned to multiples of *interval* bytes in the file, e.g.
+            to match the block size of a parallel file system.
+        """
+        _storage_kwargs(storage, ())
+        if layout not in ('vlen', 'dense'):
+            raise ValueError("Unknown acquisition layout: " + str(layout))
+
+        path = isinstance(filename, (str, bytes, os.PathLike))
+        if swmr and driver not in (None, 'sec2'):
+            raise ValueError("SWMR mode requires the sec2 driver.")
+        if driver is None and path and not swmr:
+            driver = 'stdio'
+        if backing_store is not None and driver != 'core':
+            raise ValueError("backing_store requires the core driver.")
+
+        kwargs = {}
+        if driver is not None:
+            kwargs['driver'] = driver
+        if backing_store is not None:
+            kwargs['backing_store'] = backing_store
+        if page_buf_size is not None:
+            kwargs['page_buf_size'] = page_buf_size
+            # The file space strategy can only be chosen when creating a file,
+            # which h5py does not allow in mode 'a'.
+            if mode == 'a' and path and not os.path.exists(filename):
+                mode = 'x'
+            if mode in ('w', 'w-', 'x'):
+                kwargs.update(fs_strategy='page', fs_page_size=page_size)
+        if alignment is not None:
+            kwargs['alignment_threshold'], kwargs['alignment_interval'] = alignment
+
+        if swmr:
+            kwargs.update({'swmr': True} if mode == 'r' else {'libver': 'latest'})
+
+        self.__file = h5py.File(filename, mode, **kwargs)
+        super().__init__(self.__file, storage, layout, Instrumentation(), _Cache())
+
+        if instrument:
+            self.instrument(callback=instrument if callable(instrument) else None)
+
+    def instrument(self, enabled=True, callback=None):
+        """Start or stop recording I/O statistics.
+
+        While enabled, reading, writing and extending acquisitions,
+        waveforms and images, and reading and writing headers, through any
+        container of the file records its call count, bytes and wall time
+        per operation; see :meth:`ismrmrd.Dataset.instrument`. Iterating
+        records one call per item.
+
+        Returns
+        -------
+        :class:`ismrmrd.IOStats` or None
         """
-        self.__file = h5py.File(filename, mode, driver='stdio')
-        super().__init__(self.__file)
+        if not enabled:
+            self._instrumentation.disable()
+            return None
+        return self._instrumentation.enable(callback)
+
+    def collect_stats(self, callback=None):
+        """Context manager yielding the :class:`ismrmrd.IOStats` of its block."""
+        return self._instrumentation.scope(callback)
+
+    def stats(self):
+        """Return the recorded I/O statistics; see :meth:`ismrmrd.IOStats.summary`."""
+        return self._instrumentation.summary()
+
+    def start_swmr_write(self):
+        """Start SWMR writing; no datasets or attributes can be created afterwards."""
+        self.__file.swmr_mode = True
+
+    def refresh(self):
+        """Pick up rows appended by a SWMR writer, without reopening the file."""
+        def refresh(name, item):
+            if isinstance(item, h5py.Dataset):
+                item.refresh()
+
+        self.__file.visititems(refresh)
+
+    def flush(self):
+        self.__file.flush()
 
     def __enter__(self):
         return self
@@ -1,3 +1,22 @@
+import numpy as np
+
+
+def _flag_bits(flags):
+    # Bit mask of an ISMRMRD flag number, or of a sequence of them.
+    if isinstance(flags, (int, np.integer)):
+        flags = [flags]
+    bits = 0
+    for flag in flags:
+        bits |= 1 << (int(flag) - 1)
+    return np.uint64(bits)
+
+
+def _match_flags(flags, flags_all=(), flags_none=()):
+    # Boolean mask of the entries of a uint64 array of header flags that have
+    # every flag in *flags_all* and none of the flags in *flags_none* set.
+    flags = np.asarray(flags, dtype=np.uint64)
+    required, excluded = _flag_bits(flags_all), _flag_bits(flags_none)
+    return ((flags & required) == required) & ((flags & excluded) == 0)
 
 
 class FlagsMixin(object):
@@ -1,8 +1,17 @@
 import h5py
 import numpy as np
 import ismrmrd
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from .constants import *
+from .batch import AcquisitionBatch, _uniform_shape
+from .index import EncodingIndex
+from .flags import _match_flags
+from .xsd import CreateFromDocument
+from .instrumentation import Instrumentation, instrumented
 
 # For Python 2.7 ctypes bug
 import warnings
@@ -138,13 +147,476 @@ def get_arrayhdf5type(val):
         raise TypeError("Unsupported data type.")    
     
 
+def _acquisitions_to_numpy(acquisitions, copy=False):
+    # The records refer to the data of the acquisitions unless copy is True.
+    acquisitions = list(acquisitions)
+
+    # create an empty hdf5 acquisition buffer and fill it
+    buffer = np.empty((len(acquisitions),), dtype=acquisition_dtype)
+
+    # copy the headers in one pass
+    buffer['head'] = _acquisition_headers(acquisitions)
+
+    for i, acq in enumerate(acquisitions):
+        # copy the data as float
+        data = acq.data.view(np.float32).reshape((2*acq.active_channels*acq.number_of_samples,))
+        buffer['data'][i] = data.copy() if copy else data
+
+        # copy the trajectory as float
+        traj = acq.traj.view(np.float32).reshape((acq.number_of_samples*acq.trajectory_dimensions,))
+        buffer['traj'][i] = traj.copy() if copy else traj
+
+    return buffer
+
+
+def _acquisition_headers(acquisitions):
+    return np.frombuffer(b''.join(bytes(acq._head) for acq in acquisitions), dtype=acquisition_header_dtype)
+
+
+def _waveforms_to_numpy(waveforms, copy=False):
+    # The records refer to the data of the waveforms unless copy is True.
+    buffer = np.empty((len(waveforms),), dtype=waveform_dtype)
+
+    # copy the headers in one pass
+    buffer['head'] = np.frombuffer(b''.join(bytes(wav._head) for wav in waveforms), dtype=waveform_header_dtype)
+
+    for i, wav in enumerate(waveforms):
+        data = wav.data.view(np.uint32).reshape((wav.channels * wav.number_of_samples,))
+        buffer['data'][i] = data.copy() if copy else data
+
+    return buffer
+
+
+def _waveforms_from_numpy(records):
+    # HDF5 does not guarantee data alignment, so the headers are copied into
+    # an aligned array, zeroed first to avoid garbage in the padding bytes.
+    headers = np.zeros(records.shape, dtype=waveform_header_dtype)
+    headers[:] = records['head']
+
+    return [ismrmrd.Waveform(headers[i:i + 1], raw.view(np.uint32)) for i, raw in enumerate(records['data'])]
+
+
+def _acquisition_from_numpy(raw):
+    head = raw['head']
+    return ismrmrd.Acquisition(head,
+                               raw['data'].view(np.complex64).reshape((head['active_channels'],
+                                                                       head['number_of_samples'])),
+                               raw['traj'].reshape((head['number_of_samples'],
+                                                    head['trajectory_dimensions'])))
+
+
+def _memory_dtype(dtype):
+    # ismrmrd complex data is stored as pairs named real and imag
+    if dtype.names == ('real', 'imag'):
+        return np.dtype('complex%d' % (8 * dtype.itemsize))
+    return dtype
+
+
+def _read_row(dset, index, out=None):
+    # Read one row of an image or array dataset. Complex rows are read into a
+    # complex buffer through a view with the file's ('real', 'imag') compound
+    # type, so the process-wide h5py complex_names setting is never touched.
+    dtype = _memory_dtype(dset.dtype)
+
+    if out is not None and out.dtype == dtype and out.flags.c_contiguous:
+        dset.read_direct(out.view(dset.dtype), np.s_[index])
+        return out
+
+    row = np.empty(dset.shape[1:], dtype=dtype)
+    dset.read_direct(row.view(dset.dtype), np.s_[index])
+
+    if out is None:
+        return row
+    out[...] = row
+    return out
+
+
+def _read_acquisition_headers(dset, selection=None):
+    headers = _read_selection(dset, selection, 'head')
+    return headers.astype(acquisition_header_dtype, copy=False)
+
+
+def _plan_selection(selection, length):
+    # Turn a slice, an index array or a boolean mask into rows h5py can read in
+    # a single call, plus an optional index array reordering the rows read.
+    # h5py only accepts increasing, unique indices, so other index arrays are
+    # read sorted and reordered in memory afterwards.
+    if selection is None:
+        selection = slice(None)
+
+    if isinstance(selection, slice):
+        start, stop, step = selection.indices(length)
+        if step > 0:
+            return slice(start, stop, step), None
+        selection = np.arange(start, stop, step)
+
+    indices = np.atleast_1d(np.asarray(selection))
+    if indices.ndim != 1:
+        raise IndexError("Selection must be one-dimensional.")
+
+    if indices.dtype == bool:
+        if indices.size != length:
+            raise IndexError("Boolean selection does not match the number of rows.")
+        indices = np.flatnonzero(indices)
+    elif indices.size == 0:
+        indices = indices.astype(np.intp)
+    elif not np.issubdtype(indices.dtype, np.integer):
+        raise IndexError("Selection must be a slice, an integer array or a boolean array.")
+
+    indices = np.where(indices < 0, indices + length, indices)
+    if indices.size and (indices.min() < 0 or indices.max() >= length):
+        raise IndexError("Selection out of range.")
+
+    unique, inverse = np.unique(indices, return_inverse=True)
+    if unique.size == 0:
+        return slice(0, 0), None
+
+    # dense selections are cheaper to read as one contiguous block
+    first, last = int(unique[0]), int(unique[-1]) + 1
+    if last - first <= 2 * unique.size:
+        return slice(first, last), (unique - first)[inverse]
+
+    return unique, inverse
+
+
+def _read_selection(dset, selection, *fields):
+    rows, reorder = _plan_selection(selection, _length(dset))
+    result = dset[(rows,) + fields]
+    return result if reorder is None else result[reorder]
+
+
+# Acquisitions without image data, skipped by Dataset.read_kspace() unless
+# they are selected explicitly.
+non_imaging_flags = (ACQ_IS_NOISE_MEASUREMENT, ACQ_IS_NAVIGATION_DATA, ACQ_IS_PHASECORR_DATA,
+                     ACQ_IS_HPFEEDBACK_DATA, ACQ_IS_DUMMYSCAN_DATA, ACQ_IS_RTFEEDBACK_DATA,
+                     ACQ_IS_SURFACECOILCORRECTIONSCAN_DATA, ACQ_IS_PHASE_STABILIZATION_REFERENCE,
+                     ACQ_IS_PHASE_STABILIZATION)
+
+
+def _imaging_acquisitions(headers, encoding):
+    # Rows of the acquisitions of an encoding that contribute to the image;
+    # calibration lines are only included if they are also imaging lines.
+    flags = headers['flags']
+    calibration_only = (_match_flags(flags, flags_all=ACQ_IS_PARALLEL_CALIBRATION) &
+                        ~_match_flags(flags, flags_all=ACQ_IS_PARALLEL_CALIBRATION_AND_IMAGING))
+    mask = _match_flags(flags, flags_none=non_imaging_flags) & ~calibration_only
+    return np.flatnonzero(mask & (headers['encoding_space_ref'] == encoding))
+
+
+def _encoding_offset(limit, size):
+    # Offset placing the centre line of an encoding limit at index size // 2
+    # of a matrix, where the FFT of a centred k-space puts the zero frequency.
+    if limit is None or limit.center is None:
+        return 0
+    return size // 2 - limit.center
+
+
+def _read_blocks(read, rows, block_size=256):
+    # Lazily yield the acquisitions at *rows*, reading block_size rows at a time.
+    for start in range(0, len(rows), block_size):
+        yield from read(rows[start:start + block_size])
+
+
+# Acquisitions with identical shapes can be stored in a dense layout instead
+# of the vlen 'data' records: headers in 'dense_head', samples in an
+# (N, channels, samples) complex 'dense_data' dataset and, when present,
+# trajectories in an (N, samples, dimensions) 'dense_traj' dataset.
+dense_datasets = ('dense_head', 'dense_data', 'dense_traj')
+
+dense_complex_dtype = get_hdf5type(DATATYPE_CXFLOAT)
+
+
+def _acquisitions_to_dense(acquisitions):
+    # Returns headers, data and trajectories stacked for the dense layout, or
+    # None for data and trajectories if the acquisitions differ in shape.
+    headers = _acquisition_headers(acquisitions)
+
+    shape = _uniform_shape(headers)
+    if shape is None or 0 in shape[:2]:
+        return headers, None, None
+
+    data = np.stack([acq.data for acq in acquisitions]).astype(np.complex64, copy=False)
+    traj = np.stack([acq.traj for acq in acquisitions]).astype(np.float32, copy=False)
+
+    return headers, data, traj
+
+
+def _records_to_dense(records):
+    # As _acquisitions_to_dense, for records packed by _acquisitions_to_numpy.
+    headers = np.zeros(records.shape, dtype=acquisition_header_dtype)
+    headers[:] = records['head']
+
+    shape = _uniform_shape(headers)
+    if shape is None or 0 in shape[:2]:
+        return headers, None, None
+
+    nchannels, nsamples, ndims = shape
+    data = np.stack(list(records['data'])).view(np.complex64).reshape((records.size, nchannels, nsamples))
+    traj = np.stack(list(records['traj'])).reshape((records.size, nsamples, ndims))
+
+    return headers, data, traj
+
+
+def _dense_matches(datasets, data, traj):
+    head, dense_data, dense_traj = datasets
+    return (data is not None and
+            dense_data.shape[1:] == data.shape[1:] and
+            (traj.shape[2] == 0 if dense_traj is None else dense_traj.shape[1:] == traj.shape[1:]))
+
+
+def _create_dense(group, headers, data, traj, storage=None):
+    head = _create_dataset(group, 'dense_head', headers.shape, (None,), acquisition_header_dtype, storage)
+    dense_data = _create_dataset(group, 'dense_data', data.shape, (None,) + data.shape[1:],
+                                 dense_complex_dtype, storage)
+    dense_traj = None
+    if traj.shape[2] > 0:
+        dense_traj = _create_dataset(group, 'dense_traj', traj.shape, (None,) + traj.shape[1:],
+                                     np.float32, storage)
+
+    datasets = (head, dense_data, dense_traj)
+    _write_dense(datasets, slice(0, headers.size), headers, data, traj)
+    return datasets
+
+
+def _write_dense(datasets, rows, headers, data, traj):
+    head, dense_data, dense_traj = datasets
+    head[rows] = headers
+    dense_data[rows] = data.view(dense_complex_dtype)
+    if dense_traj is not None:
+        dense_traj[rows] = traj
+
+
+def _read_dense(datasets, selection=None):
+    # Read a selection of densely stored acquisitions as an AcquisitionBatch.
+    head, dense_data, dense_traj = datasets
+
+    rows, reorder = _plan_selection(selection, _length(head))
+
+    def read(dset):
+        result = dset[rows]
+        return result if reorder is None else result[reorder]
+
+    headers = read(head).astype(acquisition_header_dtype, copy=False)
+    data = read(dense_data).view(np.complex64)
+    if dense_traj is not None:
+        traj = read(dense_traj)
+    else:
+        traj = np.zeros((headers.size, dense_data.shape[2], 0), dtype=np.float32)
+
+    return AcquisitionBatch(headers, data, traj)
+
+
+def _dense_to_vlen(group, storage=None, block_size=4096):
+    # Move densely stored acquisitions into vlen 'data' records, a block of
+    # rows at a time, and remove the dense datasets.
+    datasets = tuple(group.get(name) for name in dense_datasets)
+    length = _length(datasets[0])
+
+    records = _create_dataset(group, 'data', (length,), (None,), acquisition_dtype, storage)
+    for start in range(0, length, block_size):
+        rows = slice(start, min(start + block_size, length))
+        records[rows] = _acquisitions_to_numpy(_read_dense(datasets, rows))
+
+    for name in dense_datasets:
+        if name in group:
+            del group[name]
+
+    return records
+
+
+# Options accepted in the *storage* dictionaries of Dataset and File.
+storage_options = ('chunks', 'compression', 'compression_opts', 'shuffle', 'fletcher32')
+
+
+def _storage_kwargs(storage, shape, dtype=None):
+    # Translate a storage dictionary into h5py create_dataset keywords. An
+    # integer 'chunks' gives the number of rows per chunk along the first
+    # axis; the remaining axes are stored whole.
+    storage = dict(storage or {})
+
+    unknown = set(storage) - set(storage_options)
+    if unknown:
+        raise TypeError("Unknown storage options: " + ", ".join(sorted(unknown)))
+
+    compression = storage.get('compression')
+    if not (compression is None or compression in ('gzip', 'lzf') or
+            (isinstance(compression, int) and not isinstance(compression, bool))):
+        raise ValueError("Unsupported compression: " + str(compression))
+
+    chunks = storage.get('chunks')
+    if chunks is None:
+        chunks = True
+    elif isinstance(chunks, int) and not isinstance(chunks, bool):
+        chunks = (chunks,) + tuple(max(n, 1) for n in shape[1:])
+
+    kwargs = {'chunks': chunks}
+    for key in ('compression', 'compression_opts', 'shuffle', 'fletcher32'):
+        if storage.get(key) is not None:
+            kwargs[key] = storage[key]
+
+    # HDF5 cannot checksum top-level variable-length strings
+    if dtype is not None and h5py.check_vlen_dtype(np.dtype(dtype)) is not None:
+        kwargs.pop('fletcher32', None)
+
+    return kwargs
+
+
+def _create_dataset(group, name, shape, maxshape, dtype, storage=None, **kwargs):
+    return group.create_dataset(name, shape, maxshape=maxshape, dtype=dtype,
+                                **_storage_kwargs(storage, shape, dtype), **kwargs)
+
+
+# Appendable datasets are over-allocated while they are being written. The
+# number of rows actually in use is kept in this attribute until the dataset
+# is trimmed to its exact size on Dataset.flush() or Dataset.close().
+length_attribute = 'ismrmrd_length'
+
+
+def _length(dset):
+    # Number of rows in use in an appendable dataset; datasets without the
+    # attribute (trimmed, or written by other tools) use their whole extent.
+    return int(dset.attrs.get(length_attribute, dset.shape[0]))
+
+
+def _index(index, length):
+    index = int(index)
+    if index < 0:
+        index += length
+    if not 0 <= index < length:
+        raise IndexError("Index out of range.")
+    return index
+
+
+# Sidecar dataset holding the encoding counters of the acquisitions in the
+# same group, written by encoding_index(persist=True).
+index_dataset = 'encoding_index'
+
+
+def _encoding_index(group, length, read_headers, index=None, persist=False):
+    # Bring *index* up to date with the *length* acquisitions in *group*,
+    # starting from the sidecar dataset when there is no usable index yet.
+    # Only the headers of rows not covered yet are read.
+    if index is None or len(index) > length:
+        sidecar = group.get(index_dataset)
+        if sidecar is not None and sidecar.shape[0] <= length:
+            index = EncodingIndex(sidecar[()])
+        else:
+            index = EncodingIndex(np.empty(0, dtype=encoding_counters_dtype))
+
+    if len(index) < length:
+        index.extend(read_headers(slice(len(index), length))['idx'])
+
+    if persist:
+        sidecar = group.get(index_dataset)
+        if sidecar is None:
+            sidecar = group.create_dataset(index_dataset, shape=(0,), maxshape=(None,),
+                                           dtype=encoding_counters_dtype, chunks=True)
+        if sidecar.shape[0] != length:
+            sidecar.resize(length, axis=0)
+            sidecar[:] = index.counters
+
+    return index
+
+
+def _drop_encoding_index(group):
+    # Acquisitions were rewritten; the persisted index no longer applies.
+    if index_dataset in group:
+        del group[index_dataset]
+
+
+def _map_shard(filename, dataset_name, rows, function):
+    # Runs in a worker process of Dataset.map_acquisitions. The parent keeps
+    # the file open, so it is opened here without HDF5 file locking.
+    kwargs = {'locking': False} if h5py.version.version_tuple[:2] >= (3, 5) else {}
+    with h5py.File(filename, 'r', **kwargs) as file:
+        group = file[dataset_name]
+        if 'dense_head' in group:
+            batch = _read_dense(tuple(group.get(name) for name in dense_datasets), rows)
+        else:
+            batch = AcquisitionBatch.from_records(_read_selection(group['data'], rows))
+
+    if function is None:
+        return batch
+    return function(batch)
+
+
+class _BackgroundWriter(object):
+    # A single thread writing queued appends to a Dataset. Appends are
+    # queued as records already packed by the caller, so that bad input raises
+    # in the call that passed it and later changes to the appended objects do
+    # not affect the file. Consecutive appends of the same kind are written as
+    # one batch, and the bounded queue blocks producers while it is full. The
+    # first error is kept and re-raised by put() and check(); later appends
+    # are discarded.
+
+    def __init__(self, dataset, queue_size):
+        self._dataset = dataset
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='ismrmrd-hdf5-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, kind, items, storage):
+        self.check()
+        self._queue.put((kind, items, storage))
+
+    def join(self):
+        # Wait for the queue to drain; a no-op on the writer thread itself.
+        if threading.current_thread() is not self._thread:
+            self._queue.join()
+
+    def check(self):
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            while pending[-1] is not None:
+                try:
+                    pending.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                if self._error is None:
+                    self._write([item for item in pending if item is not None])
+            except BaseException as error:
+                self._error = error
+            finally:
+                for _ in pending:
+                    self._queue.task_done()
+
+            if pending[-1] is None:
+                return
+
+    def _write(self, pending):
+        while pending:
+            kind, records, storage = pending.pop(0)
+            batch = [records]
+            while pending and pending[0][0] == kind and pending[0][2] is storage:
+                batch.append(pending.pop(0)[1])
+            records = np.concatenate(batch) if len(batch) > 1 else records
+
+            if kind == 'acquisitions':
+                self._dataset._append_acquisitions(records, storage)
+            else:
+                self._dataset._append_waveforms(records, storage)
+
+
 def fileinfo(fname):
     with h5py.File(fname, 'r') as f:
         return list(f.keys())
 
 
 class Dataset(object):
-    def __init__(self, filename, dataset_name="dataset", create_if_needed=True, mode=None):
+    def __init__(self, filename, dataset_name="dataset", create_if_needed=True, mode=None, storage=None,
+                 growth_factor=2.0, rdcc_nbytes=None, rdcc_nslots=None, rdcc_w0=None, layout='vlen',
+                 background_writes=False, queue_size=64, swmr=False, instrument=False):
         """Open an ISMRMRD Dataset backed by an HDF5 file.
 
         Parameters
@@ -163,7 +635,79 @@ class Dataset(object):
             same as for :func:`h5py.File`: ``'r'``, ``'r+'``, ``'w'``,
             ``'w-'``/``'x'``, and ``'a'``.  See
             https://docs.h5py.org/en/stable/high/file.html for details.
+        storage : dict, optional
+            Storage options applied to every dataset created in the file.
+            Recognised keys are ``'chunks'`` (``True`` for automatic
+            chunking, an integer number of rows per chunk, or an explicit
+            chunk shape), ``'compression'`` (``'gzip'``, ``'lzf'`` or a gzip
+            level), ``'compression_opts'``, ``'shuffle'`` and
+            ``'fletcher32'``. The ``append_*`` methods accept the same
+            dictionary to override these options for the datasets they
+            create. Note that HDF5 filters do not apply to the
+            variable-length data and trajectory payloads of acquisition and
+            waveform records, which are kept in the global heap.
+        growth_factor : float, optional
+            Appendable datasets grow their capacity by this factor whenever
+            they run out of rows, so that appends do not resize the dataset
+            every time. The rows in use are tracked in the
+            ``ismrmrd_length`` attribute and the datasets are trimmed to
+            their exact size by :meth:`flush` and :meth:`close`. Pass
+            ``None`` to grow datasets by exactly the appended rows.
+        rdcc_nbytes, rdcc_nslots, rdcc_w0 : optional
+            Raw data chunk cache settings passed on to :func:`h5py.File`: the
+            cache size in bytes per dataset, the number of hash table slots
+            and the preemption policy. The HDF5 default of 1 MiB is easily
+            exceeded by chunks of large acquisition records.
+        layout : str, optional
+            Storage layout for new acquisitions. ``'vlen'`` (default) writes
+            the variable-length records read by every ISMRMRD
+            implementation. ``'dense'`` stores headers, data and trajectories
+            in separate fixed-shape datasets that can be compressed and read
+            in bulk; it is used as long as every acquisition has the same
+            number of channels, samples and trajectory dimensions, and the
+            acquisitions are moved to the vlen layout as soon as one does
+            not. Both layouts are read transparently.
+        background_writes : bool, optional
+            When True, the ``append_acquisition(s)`` and
+            ``append_waveform(s)`` methods return as soon as their arguments
+            are queued, and a single writer thread writes them to the file,
+            batching consecutive appends. Every other operation, including
+            reads, first waits for the queued appends to be written.
+            :meth:`flush` and :meth:`close` also wait for the queue to drain
+            and raise any error the writer thread ran into; so do later
+            appends. The appended objects are packed before they are queued,
+            so invalid ones raise in the append call and they may be modified
+            as soon as it returns.
+        queue_size : int, optional
+            Number of append calls that may be pending with
+            *background_writes*. Appends block while the queue is full.
+        swmr : bool, optional
+            Use HDF5 single-writer/multiple-reader mode, so that readers can
+            follow a file while it is being written. Opened with
+            ``mode='r'``, the dataset is a SWMR reader and :meth:`refresh`
+            picks up rows appended since it was opened. Otherwise the file is
+            opened with the latest HDF5 file format, the chunked ``data`` and
+            ``waveforms`` datasets are created up front, and SWMR writing
+            starts with the first acquisition or waveform appended. The XML
+            header, images and arrays must be written before that, as no new
+            datasets can be created while SWMR writing is in progress.
+            Appends grow the datasets by exactly the appended rows and flush
+            them, so readers see every appended row. Requires the vlen
+            acquisition layout.
+        instrument : bool or callable, optional
+            Record I/O statistics from the start; see :meth:`instrument`. A
+            callable is used as its callback.
         """
+        self._instrumentation = Instrumentation()
+        if instrument:
+            self.instrument(callback=instrument if callable(instrument) else None)
+
+        if layout not in ('vlen', 'dense'):
+            raise ValueError("Unknown acquisition layout: " + str(layout))
+        if swmr and layout != 'vlen':
+            raise ValueError("SWMR mode requires the vlen acquisition layout.")
+        _storage_kwargs(storage, ())
+
         # Open the file
         if mode is None:
             if create_if_needed:
@@ -171,9 +715,33 @@ class Dataset(object):
             else:
                 mode = 'r+'
 
-        self._file = h5py.File(filename, mode)
+        swmr_kwargs = {}
+        if swmr:
+            swmr_kwargs = {'swmr': True} if mode == 'r' else {'libver': 'latest'}
+
+        self._file = h5py.File(filename, mode, rdcc_nbytes=rdcc_nbytes, rdcc_nslots=rdcc_nslots, rdcc_w0=rdcc_w0,
+                               **swmr_kwargs)
 
         self._dataset_name = dataset_name
+        self._storage = storage
+        self._growth_factor = growth_factor
+        self._growing = {}
+        self._handles = {}
+        self._layout = layout
+        self._swmr = swmr and mode != 'r'
+        self._encoding_index = None
+        self._writer = None
+
+        if self._swmr:
+            # SWMR writers can neither create datasets nor write the length
+            # attribute once SWMR writing has started
+            self._growth_factor = None
+            if self._lookup('data') is None:
+                self._create('data', (0,), (None,), acquisition_dtype)
+            if self._lookup('waveforms') is None:
+                self._create('waveforms', (0,), (None,), waveform_dtype)
+        if background_writes:
+            self._writer = _BackgroundWriter(self, queue_size)
 
     def __del__(self):
         try:
@@ -187,173 +755,616 @@ class Dataset(object):
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def _lookup(self, path):
+        # Return the cached h5py handle for *path* inside the dataset group, or
+        # None when it does not exist. Misses are not cached, so objects
+        # created later are picked up on the next lookup.
+        if self._writer is not None:
+            self._writer.join()
+
+        handle = self._handles.get(path)
+        if handle is None:
+            name = self._dataset_name + '/' + path if path else self._dataset_name
+            if name in self._file:
+                handle = self._handles[path] = self._file[name]
+        return handle
+
+    def _require(self, path, message):
+        handle = self._lookup(path)
+        if handle is None:
+            raise LookupError(message)
+        return handle
+
+    def _create(self, path, shape, maxshape, dtype, storage=None):
+        group = self._file.require_group(self._dataset_name)
+        handle = _create_dataset(group, path, shape, maxshape, dtype, storage or self._storage)
+        self._handles[path] = handle
+        return handle
+
     @property
     def _dataset(self):
-        if self._dataset_name not in self._file:
-            raise LookupError("Dataset not found in the hdf5 file.")
-        return self._file[self._dataset_name]
+        return self._require('', "Dataset not found in the hdf5 file.")
 
     def list(self):
         return self._dataset.keys()
 
+    def instrument(self, enabled=True, callback=None):
+        """Start or stop recording I/O statistics.
+
+        While enabled, every read, append and write of acquisitions, images,
+        arrays, waveforms and the XML header records its call count, bytes
+        and wall time per operation; see :class:`ismrmrd.IOStats`. Appends
+        queued with *background_writes* record the time taken to queue them.
+        Starting discards the statistics recorded so far.
+
+        Parameters
+        ----------
+        enabled : bool, optional
+            Start (default) or stop recording.
+        callback : callable, optional
+            Called as ``callback(operation, nbytes, seconds)`` after every
+            recorded call.
+
+        Returns
+        -------
+        :class:`ismrmrd.IOStats` or None
+        """
+        if not enabled:
+            self._instrumentation.disable()
+            return None
+        return self._instrumentation.enable(callback)
+
+    def collect_stats(self, callback=None):
+        """Context manager recording I/O statistics within its block.
+
+        Yields the :class:`ismrmrd.IOStats` of the block. Calls made in the
+        block are also recorded by an enclosing :meth:`instrument`.
+        """
+        return self._instrumentation.scope(callback)
+
+    def stats(self):
+        """Return the recorded I/O statistics; see :meth:`ismrmrd.IOStats.summary`."""
+        return self._instrumentation.summary()
+
+    def refresh(self):
+        """Pick up rows appended by a SWMR writer since the last refresh.
+
+        Only the metadata of the datasets already in use is reloaded; the
+        file is not reopened.
+        """
+        for handle in self._handles.values():
+            if isinstance(handle, h5py.Dataset):
+                handle.refresh()
+
+    def _swmr_append(self):
+        if self._swmr and not self._file.swmr_mode:
+            self._file.swmr_mode = True
+
+    def flush(self):
+        """Write queued appends, trim over-allocated datasets and flush the file to disk."""
+        if self._writer is not None:
+            self._writer.join()
+            self._writer.check()
+
+        for path in list(self._growing):
+            self._trim(path)
+        self._file.flush()
+
     def close(self):
-        self._file.close()
+        writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop()
 
+        try:
+            if writer is not None:
+                writer.check()
+        finally:
+            if self._file:
+                self.flush()
+            self._handles.clear()
+            self._file.close()
+
+    def _reserve(self, path, count):
+        # Make room for *count* more rows in an appendable dataset and return
+        # the index of the first one.
+        dset = self._lookup(path)
+
+        length = self._growing.get(path)
+        if length is None:
+            length = _length(dset)
+
+        needed = length + count
+        if needed > dset.shape[0]:
+            capacity = needed
+            if self._growth_factor is not None:
+                capacity = max(needed, int(np.ceil(dset.shape[0] * self._growth_factor)))
+            dset.resize(capacity, axis=0)
+
+        if needed < dset.shape[0] or path in self._growing or length_attribute in dset.attrs:
+            dset.attrs[length_attribute] = needed
+            self._growing[path] = needed
+
+        return length
+
+    def _trim(self, path):
+        dset = self._lookup(path)
+        dset.resize(_length(dset), axis=0)
+        if length_attribute in dset.attrs:
+            del dset.attrs[length_attribute]
+        self._growing.pop(path, None)
+
+    @instrumented('read_header')
     def read_xml_header(self):
-        if 'xml' not in self._dataset:
-            raise LookupError("XML header not found in the dataset.")
-        return self._dataset['xml'][0]
+        return self._require('xml', "XML header not found in the dataset.")[0]
 
+    @instrumented('write_header', 0)
     def write_xml_header(self,xmlstring):
         # create the dataset if needed
-        self._file.require_group(self._dataset_name)
-
-        dset = self._dataset.require_dataset('xml',shape=(1,), dtype=h5py.special_dtype(vlen=bytes))
+        dset = self._lookup('xml')
+        if dset is None:
+            group = self._file.require_group(self._dataset_name)
+            dset = self._handles['xml'] = group.require_dataset('xml',shape=(1,), dtype=h5py.special_dtype(vlen=bytes))
         dset[0] = xmlstring
 
+    def _dense(self):
+        # Handles of the dense acquisition datasets, or None for the vlen layout.
+        head = self._lookup('dense_head')
+        if head is None:
+            return None
+        return head, self._lookup('dense_data'), self._lookup('dense_traj')
+
+    def _acquisition_records(self):
+        return self._require('data', "Acquisition data not found in the dataset.")
+
     def number_of_acquisitions(self):
-        if 'data' not in self._dataset:
-            raise LookupError("Acquisition data not found in the dataset.")
-        return self._dataset['data'].size
+        dense = self._dense()
+        if dense is not None:
+            return _length(dense[0])
+        return _length(self._acquisition_records())
 
+    @instrumented('read_acquisition')
     def read_acquisition(self, acqnum):
-        if 'data' not in self._dataset:
-            raise LookupError("Acquisition data not found in the dataset.")
-        
-        # create an acquisition
-        # and fill with the header for this acquisition
-        acq = ismrmrd.Acquisition(self._dataset['data'][acqnum]['head'])
+        dense = self._dense()
+        if dense is not None:
+            return _read_dense(dense, [acqnum])[0]
 
-        # copy the data as complex float
-        acq.data[:] = self._dataset['data'][acqnum]['data'].view(np.complex64).reshape((acq.active_channels, acq.number_of_samples))[:]
+        dset = self._acquisition_records()
 
-        # copy the trajectory as float
-        if acq.traj.size>0:
-            acq.traj[:] = self._dataset['data'][acqnum]['traj'].reshape((acq.number_of_samples,acq.trajectory_dimensions))[:]
+        # read the whole record once and build the acquisition from it
+        return _acquisition_from_numpy(dset[_index(acqnum, _length(dset))])
 
-        return acq
+    @instrumented('read_acquisition')
+    def read_acquisitions(self, selection=None, batch=False):
+        """Read a selection of acquisitions with a single HDF5 read.
 
-    def append_acquisition(self, acq):
-        # create the dataset if needed
-        self._file.require_group(self._dataset_name)
-        
-        # extend by 1
-        if 'data' in self._dataset:
-            acqnum = self._dataset['data'].shape[0]
-            self._dataset['data'].resize(acqnum+1,axis=0)
+        Parameters
+        ----------
+        selection : slice, array of int or array of bool, optional
+            Rows to read. Index arrays may be unordered and contain
+            duplicates; boolean masks must cover every acquisition. When
+            omitted, all acquisitions are read.
+        batch : bool, optional
+            When True, return an :class:`ismrmrd.AcquisitionBatch` with
+            stacked data instead of a list of acquisitions.
+
+        Returns
+        -------
+        list of :class:`ismrmrd.Acquisition` or :class:`ismrmrd.AcquisitionBatch`
+        """
+        dense = self._dense()
+        if dense is not None:
+            acquisitions = _read_dense(dense, selection)
+            return acquisitions if batch else acquisitions.to_acquisitions()
+
+        records = _read_selection(self._acquisition_records(), selection)
+
+        if batch:
+            return AcquisitionBatch.from_records(records)
+        return [_acquisition_from_numpy(raw) for raw in records]
+
+    @instrumented('read_acquisition_header')
+    def read_acquisition_headers(self, selection=None):
+        """Read acquisition headers without reading data or trajectories.
+
+        Only the ``head`` member of the acquisition records is read from the
+        file, so this is much cheaper than :meth:`read_acquisitions`.
+
+        Parameters
+        ----------
+        selection : slice, array of int or array of bool, optional
+            Rows to read, as for :meth:`read_acquisitions`. When omitted, all
+            headers are read.
+
+        Returns
+        -------
+        numpy.ndarray
+            Structured array of ``acquisition_header_dtype``.
+        """
+        dense = self._dense()
+        if dense is not None:
+            return _read_selection(dense[0], selection).astype(acquisition_header_dtype, copy=False)
+
+        return _read_acquisition_headers(self._acquisition_records(), selection)
+
+    def encoding_index(self, persist=False):
+        """Return an :class:`ismrmrd.EncodingIndex` of the acquisitions.
+
+        The index is built from the acquisition headers in a single
+        header-only read and kept up to date incrementally: later calls only
+        read the headers of acquisitions appended since.
+
+        Parameters
+        ----------
+        persist : bool, optional
+            Also store the index in an ``encoding_index`` dataset next to the
+            acquisitions, from which it is loaded the next time the file is
+            opened. The dataset is removed when acquisitions are rewritten.
+        """
+        self._encoding_index = _encoding_index(self._dataset, self.number_of_acquisitions(),
+                                               self.read_acquisition_headers, self._encoding_index, persist)
+        return self._encoding_index
+
+    def find_acquisitions(self, **counters):
+        """Rows of the acquisitions with the given encoding counters.
+
+        For example, ``dataset.find_acquisitions(slice=3, repetition=7)``
+        returns the rows of every readout of slice 3 in repetition 7, which
+        can be passed to :meth:`read_acquisitions`. Keywords are
+        :class:`ismrmrd.EncodingCounters` field names; see
+        :meth:`encoding_index`.
+        """
+        return self.encoding_index().rows(**counters)
+
+    def select(self, flags_all=(), flags_none=(), decode=False):
+        """Select acquisitions by their header flags.
+
+        Only the acquisition headers are read; the flags are tested for all
+        acquisitions at once with NumPy bit operations. For example,
+        ``dataset.select(flags_none=[ismrmrd.ACQ_IS_NOISE_MEASUREMENT])``
+        selects every acquisition that is not a noise measurement.
+
+        Parameters
+        ----------
+        flags_all : int or sequence of int, optional
+            Flags (``ACQ_*`` constants) that must all be set.
+        flags_none : int or sequence of int, optional
+            Flags of which none may be set.
+        decode : bool, optional
+            When True, return an iterator decoding the selected acquisitions
+            lazily, a block of rows at a time, instead of their rows.
+
+        Returns
+        -------
+        numpy.ndarray of rows, or iterator of :class:`ismrmrd.Acquisition`
+        """
+        dense = self._dense()
+        if dense is not None:
+            flags = _read_selection(dense[0], None, 'flags')
         else:
-            self._dataset.create_dataset("data", (1,), maxshape=(None,), dtype=acquisition_dtype)
-            acqnum = 0
+            flags = self.read_acquisition_headers()['flags']
+
+        rows = np.flatnonzero(_match_flags(flags, flags_all, flags_none))
+        if decode:
+            return _read_blocks(self.read_acquisitions, rows)
+        return rows
+
+    @instrumented('read_acquisition')
+    def read_kspace(self, selection=None, encoding=0, header=None, block_size=1024):
+        """Assemble acquisitions into a k-space array.
+
+        Readouts are placed in a ``(contrast, slice, coil, kz, ky, kx)``
+        complex64 array, using their encoding counters for the contrast,
+        slice, ``kspace_encode_step_2`` and ``kspace_encode_step_1``
+        positions. The numbers of contrasts and slices come from the encoding
+        limits of the XML header, ``kz`` and ``ky`` from the encoded matrix
+        size, with the line at the ``center`` of the ``kspace_encoding_step_1``
+        and ``kspace_encoding_step_2`` limits placed at index ``size // 2``,
+        and ``kx`` is the number of samples per readout. Readouts that share a
+        position, e.g. in different repetitions or averages, overwrite each
+        other in acquisition order; select a single repetition with
+        :meth:`find_acquisitions` to avoid that.
+
+        Rows are read and placed *block_size* at a time, so that only the
+        k-space array and one block of readouts are held in memory.
+
+        Parameters
+        ----------
+        selection : slice, array of int or array of bool, optional
+            Acquisitions to use. By default, every acquisition of *encoding*
+            that carries image data is used: noise, navigator, phase
+            correction, feedback, dummy scan and calibration-only lines are
+            left out.
+        encoding : int, optional
+            Index of the encoding in the XML header.
+        header : ismrmrd.xsd.ismrmrdHeader, optional
+            Header to take the encoding from, instead of the dataset's.
+
+        Returns
+        -------
+        numpy.ndarray
+
+        Raises
+        ------
+        ValueError
+            If the acquisitions differ in their shape, if their contrast or
+            slice exceeds the encoding limits, or if a centred line falls
+            outside of the encoded matrix.
+        """
+        if header is None:
+            header = CreateFromDocument(self.read_xml_header())
+        enc = header.encoding[encoding]
+        limits = enc.encodingLimits
+        matrix = enc.encodedSpace.matrixSize
+
+        headers = self.read_acquisition_headers()
+        if selection is None:
+            rows = _imaging_acquisitions(headers, encoding)
+        else:
+            rows, reorder = _plan_selection(selection, headers.size)
+            rows = np.arange(headers.size)[rows]
+            if reorder is not None:
+                rows = rows[reorder]
+        headers = headers[rows]
+
+        shape = _uniform_shape(headers) if headers.size else (1, matrix.x, 0)
+        if shape is None:
+            raise ValueError("Acquisitions differ in their number of channels or samples.")
+        ncoils, nsamples, _ = shape
+
+        ncontrasts, nslices = 1, 1
+        if limits is not None and limits.contrast is not None:
+            ncontrasts = limits.contrast.maximum + 1
+        if limits is not None and limits.slice is not None:
+            nslices = limits.slice.maximum + 1
+
+        ky_offset = _encoding_offset(limits.kspace_encoding_step_1 if limits is not None else None, matrix.y)
+        kz_offset = _encoding_offset(limits.kspace_encoding_step_2 if limits is not None else None, matrix.z)
+
+        idx = headers['idx']
+        contrast, slice_ = idx['contrast'].astype(np.intp), idx['slice'].astype(np.intp)
+        kz = idx['kspace_encode_step_2'].astype(np.intp) + kz_offset
+        ky = idx['kspace_encode_step_1'].astype(np.intp) + ky_offset
+
+        # out of range positions would fail as bare IndexErrors, or silently
+        # wrap around to the other end if negative
+        for name, positions, size, offset in [('contrast', contrast, ncontrasts, 0),
+                                              ('slice', slice_, nslices, 0),
+                                              ('kspace_encode_step_1', ky, matrix.y, ky_offset),
+                                              ('kspace_encode_step_2', kz, matrix.z, kz_offset)]:
+            outside = np.flatnonzero((positions < 0) | (positions >= size))
+            if outside.size:
+                raise ValueError(f"Acquisition {rows[outside[0]]} has {name} {positions[outside[0]] - offset}, "
+                                 f"outside of the {size} positions of the encoding in the XML header.")
+
+        kspace = np.zeros((ncontrasts, nslices, ncoils, matrix.z, matrix.y, nsamples), dtype=np.complex64)
+
+        for start in range(0, rows.size, block_size):
+            block = slice(start, start + block_size)
+            data = self.read_acquisitions(rows[block], batch=True).data
+            kspace[contrast[block], slice_[block], :, kz[block], ky[block], :] = data
+
+        return kspace
+
+    def map_acquisitions(self, function=None, processes=None, shard_size=None, ordered=True, mp_context=None):
+        """Read and process acquisitions in parallel worker processes.
+
+        h5py serialises all I/O behind a global lock, so threads cannot read
+        or decode a file concurrently. This splits the acquisitions into
+        contiguous shards, each of which is read by a worker process that
+        opens the file read-only on its own.
 
-        # create an empty hdf5 acquisition and fill it
-        h5acq = np.empty((1,), dtype=acquisition_dtype)
-        # copy the header
+        Parameters
+        ----------
+        function : callable, optional
+            Called in the worker with the :class:`ismrmrd.AcquisitionBatch`
+            of a shard; its return value is sent back to the caller. Must be
+            picklable, e.g. a module-level function. When omitted, the
+            batches themselves are returned.
+        processes : int, optional
+            Number of worker processes. Defaults to the number of CPUs.
+        shard_size : int, optional
+            Number of acquisitions per shard. Defaults to spreading the
+            acquisitions over four shards per process.
+        ordered : bool, optional
+            When True (default), results are yielded in shard order.
+            Otherwise they are yielded as soon as each shard completes.
+        mp_context : multiprocessing context, optional
+            Context used to start the workers. Defaults to ``'spawn'``, as
+            HDF5 is not safe to use in forked children of a process that has
+            files open.
+
+        Yields
+        ------
+        The result of *function*, or an :class:`ismrmrd.AcquisitionBatch`,
+        for each shard.
+        """
+        # make every appended row visible to the workers
+        self.flush()
+
+        length = self.number_of_acquisitions()
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if shard_size is None:
+            shard_size = max(1, -(-length // (4 * processes)))
+        if mp_context is None:
+            mp_context = multiprocessing.get_context('spawn')
+
+        shards = [slice(start, min(start + shard_size, length)) for start in range(0, length, shard_size)]
+        if not shards:
+            return
+
+        executor = ProcessPoolExecutor(min(processes, len(shards)), mp_context=mp_context)
+        try:
+            futures = [executor.submit(_map_shard, self._file.filename, self._dataset_name, rows, function)
+                       for rows in shards]
+            for future in (futures if ordered else as_completed(futures)):
+                yield future.result()
+        finally:
+            executor.shutdown(cancel_futures=True)
 
-        h5acq[0]['head'] = np.frombuffer(acq.getHead(), dtype=acquisition_header_dtype)
+    @instrumented('append_acquisition', 0)
+    def append_acquisition(self, acq, storage=None):
+        self.append_acquisitions([acq], storage=storage)
 
-        # copy the data as float
-        h5acq[0]['data'] = acq.data.view(np.float32).reshape((2*acq.active_channels*acq.number_of_samples,))
-        
-        # copy the trajectory as float
-        h5acq[0]['traj'] = acq.traj.view(np.float32).reshape((acq.number_of_samples*acq.trajectory_dimensions,))
+    @instrumented('append_acquisition', 0)
+    def append_acquisitions(self, acquisitions, storage=None):
+        """Append a batch of acquisitions to the dataset.
 
-        # put it into the hdf5 file
-        self._dataset['data'][acqnum] = h5acq[0]
+        All acquisitions are packed into a single buffer, and the acquisition
+        datasets are resized and written once per batch rather than once per
+        readout.
 
-    def write_acquisition(self,acq,acqnum):
+        Parameters
+        ----------
+        acquisitions : iterable of :class:`ismrmrd.Acquisition`
+            Acquisitions to append, in order.
+        storage : dict, optional
+            Storage options used if the acquisition datasets have to be
+            created. Defaults to the options given to the constructor.
+        """
+        acquisitions = list(acquisitions)
+        if not acquisitions:
+            return
 
-        # create an empty hdf5 acquisition and fill it
-        h5acq = np.empty((1,), dtype=acquisition_dtype)
-        # copy the header
+        if self._writer is not None:
+            self._writer.put('acquisitions', _acquisitions_to_numpy(acquisitions, copy=True), storage)
+        else:
+            self._append_acquisitions(acquisitions, storage)
 
-        h5acq[0]['head'] = np.frombuffer(acq.getHead(), dtype=acquisition_header_dtype)
+    def _append_acquisitions(self, acquisitions, storage):
+        # acquisitions is a list of Acquisition, or the records packed by
+        # _acquisitions_to_numpy that the background writer is given.
+        self._swmr_append()
 
-        # copy the data as float
-        h5acq[0]['data'] = acq.data.view(np.float32).reshape((2*acq.active_channels*acq.number_of_samples,))
+        if self._lookup('data') is None:
+            if self._layout == 'dense' or self._dense() is not None:
+                if self._append_dense(acquisitions, storage):
+                    return
 
-        # copy the trajectory as float
-        h5acq[0]['traj'] = acq.traj.view(np.float32).reshape((acq.number_of_samples*acq.trajectory_dimensions,))
+        buffer = acquisitions if isinstance(acquisitions, np.ndarray) else _acquisitions_to_numpy(acquisitions)
+
+        # extend by the size of the batch, creating the dataset if needed
+        dset = self._lookup('data')
+        if dset is not None:
+            acqnum = self._reserve('data', buffer.size)
+        else:
+            dset = self._create('data', (buffer.size,), (None,), acquisition_dtype, storage)
+            acqnum = 0
+
+        # put it into the hdf5 file
+        dset[acqnum:acqnum + buffer.size] = buffer
+
+        if self._swmr:
+            dset.flush()
+
+    def _append_dense(self, acquisitions, storage):
+        # Append to the dense layout; returns False, after moving any dense
+        # acquisitions to vlen records, if the shapes do not fit it.
+        if isinstance(acquisitions, np.ndarray):
+            headers, data, traj = _records_to_dense(acquisitions)
+        else:
+            headers, data, traj = _acquisitions_to_dense(acquisitions)
+
+        dense = self._dense()
+        if dense is None:
+            if data is None:
+                return False
+            group = self._file.require_group(self._dataset_name)
+            dense = _create_dense(group, headers, data, traj, storage or self._storage)
+            self._handles.update(zip(dense_datasets, dense))
+            return True
+
+        if not _dense_matches(dense, data, traj):
+            self._convert_to_vlen(storage)
+            return False
+
+        acqnum = self._reserve('dense_head', headers.size)
+        self._reserve('dense_data', headers.size)
+        if dense[2] is not None:
+            self._reserve('dense_traj', headers.size)
+
+        _write_dense(dense, slice(acqnum, acqnum + headers.size), headers, data, traj)
+        return True
+
+    def _convert_to_vlen(self, storage=None):
+        for name in dense_datasets:
+            self._handles.pop(name, None)
+            self._growing.pop(name, None)
+        self._handles['data'] = _dense_to_vlen(self._dataset, storage or self._storage)
+
+    @instrumented('write_acquisition', 0)
+    def write_acquisition(self,acq,acqnum):
+        self._encoding_index = None
+        _drop_encoding_index(self._dataset)
+
+        dense = self._dense()
+        if dense is not None:
+            headers, data, traj = _acquisitions_to_dense([acq])
+            if _dense_matches(dense, data, traj):
+                _write_dense(dense, _index(acqnum, _length(dense[0])), headers[0], data[0], traj[0])
+                return
+            self._convert_to_vlen()
 
         # put it into the hdf5 file
-        self._dataset['data'][acqnum] = h5acq[0]
+        dset = self._acquisition_records()
+        dset[_index(acqnum, _length(dset))] = _acquisitions_to_numpy([acq])[0]
 
 
     def number_of_images(self, impath):
-        if impath not in self._dataset:
-            raise LookupError("Image data not found in the dataset.")
-        return self._dataset[impath]['header'].shape[0]
+        return _length(self._require(impath + '/header', "Image data not found in the dataset."))
     
+    @instrumented('read_image')
     def read_image(self, impath, imnum):
-        if impath not in self._dataset:
-            raise LookupError("Image data not found in the dataset.")
+        header = self._require(impath + '/header', "Image data not found in the dataset.")
         
         # create an image
         # and fill with the header and attribute string for this image
-        im = ismrmrd.Image(self._dataset[impath]['header'][imnum], self._dataset[impath]['attributes'][imnum])
+        imnum = _index(imnum, _length(header))
+        im = ismrmrd.Image(header[imnum], self._lookup(impath + '/attributes')[imnum])
 
-        # copy the data
-        # ismrmrd complex data is stored as pairs named real and imag
-        # TODO do we need to store and reset or the config local to the module?
-        cplxcfg = h5py.get_config().complex_names
-        h5py.get_config().complex_names = ('real','imag')
-        im.data[:] = self._dataset[impath]['data'][imnum]
-        h5py.get_config().complex_names = cplxcfg
+        # read the data straight into the image buffer
+        _read_row(self._lookup(impath + '/data'), imnum, out=im.data)
 
         return im
     
-    def append_image(self, impath, im):
-        # create the dataset if needed
-        self._file.require_group(self._dataset_name)
-
-        # create the image if needed
-        self._dataset.require_group(impath)
-        
-        # extend by 1
-        if 'header' in self._dataset[impath]:
-            imnum = self._dataset[impath]['header'].shape[0]
-            # check that they are all equal
-            self._dataset[impath]['header'].resize(imnum+1,axis=0)
-            self._dataset[impath]['attributes'].resize(imnum+1,axis=0)
-            self._dataset[impath]['data'].resize(imnum+1,axis=0)
+    @instrumented('append_image', 1)
+    def append_image(self, impath, im, storage=None):
+        paths = [impath + '/header', impath + '/attributes', impath + '/data']
+
+        # extend by 1, creating the image datasets if needed
+        if self._lookup(paths[0]) is not None:
+            imnum = self._reserve(paths[0], 1)
+            self._reserve(paths[1], 1)
+            self._reserve(paths[2], 1)
         else:
-            self._dataset[impath].create_dataset("header", (1,), maxshape=(None,), dtype=image_header_dtype)
-            self._dataset[impath].create_dataset("attributes", (1,), maxshape=(None,), dtype=h5py.special_dtype(vlen=str))
-            self._dataset[impath].create_dataset("data", (1,im.data.shape[0],im.data.shape[1],im.data.shape[2],im.data.shape[3]),
-                                                maxshape=(None,im.data.shape[0],im.data.shape[1],im.data.shape[2],im.data.shape[3]), dtype=get_hdf5type(im.data_type))
+            self._create(paths[0], (1,), (None,), image_header_dtype, storage)
+            self._create(paths[1], (1,), (None,), h5py.special_dtype(vlen=str), storage)
+            self._create(paths[2], (1,) + im.data.shape, (None,) + im.data.shape,
+                         get_hdf5type(im.data_type), storage)
             imnum = 0
 
-        self._dataset[impath]['header'][imnum] = np.frombuffer(im.getHead(), dtype=image_header_dtype)
+        header, attributes, data = (self._handles[path] for path in paths)
+
+        header[imnum] = np.frombuffer(im.getHead(), dtype=image_header_dtype)
         # put the attribute string
-        self._dataset[impath]['attributes'][imnum] = im.attribute_string
+        attributes[imnum] = im.attribute_string
         # put the data
-        self._dataset[impath]['data'][imnum] = im.data.view(dtype=get_hdf5type(im.data_type))
+        data[imnum] = im.data.view(dtype=get_hdf5type(im.data_type))
 
     def number_of_arrays(self, arrpath):
-        if arrpath not in self._dataset:
-            raise LookupError("Array data not found in the dataset.")
-        return self._dataset[arrpath].shape[0]
+        return _length(self._require(arrpath, "Array data not found in the dataset."))
     
+    @instrumented('read_array')
     def read_array(self, arrpath, arrnum):
-        if arrpath not in self._dataset:
-            raise LookupError("Array data not found in the dataset.")
+        dset = self._require(arrpath, "Array data not found in the dataset.")
         
-        # ismrmrd complex data is stored as pairs named real and imag
-        # TODO do we need to store and reset or the config local to the module?
-        cplxcfg = h5py.get_config().complex_names
-        h5py.get_config().complex_names = ('real','imag')
-        arr = np.copy(self._dataset[arrpath][arrnum])
-        h5py.get_config().complex_names = cplxcfg
-
-        return arr
+        return _read_row(dset, _index(arrnum, _length(dset)))
     
-    def append_array(self, arrpath, arr):
-        # create the dataset if needed
-        self._file.require_group(self._dataset_name)
-
-        # extend by 1
-        if arrpath in self._dataset:
-            arrnum = self._dataset[arrpath].shape[0]
-            self._dataset[arrpath].resize(arrnum+1,axis=0)
+    @instrumented('append_array', 1)
+    def append_array(self, arrpath, arr, storage=None):
+        # extend by 1, creating the dataset if needed
+        if self._lookup(arrpath) is not None:
+            arrnum = self._reserve(arrpath, 1)
         else:
             shape = list(arr.shape)
             shape.insert(0,1)            
@@ -361,56 +1372,128 @@ class Dataset(object):
             maxshape = list(arr.shape)
             maxshape.insert(0,None)
             maxshape = tuple(maxshape)
-            self._dataset.create_dataset(arrpath, shape, maxshape=maxshape, dtype=get_arrayhdf5type(arr.dtype))
+            self._create(arrpath, shape, maxshape, get_arrayhdf5type(arr.dtype), storage)
             arrnum = 0
         
         # put the data
-        self._dataset[arrpath][arrnum] = arr.view(dtype=get_arrayhdf5type(arr.dtype))
+        self._handles[arrpath][arrnum] = arr.view(dtype=get_arrayhdf5type(arr.dtype))
 
     def number_of_waveforms(self):
-        if 'waveforms' not in self._dataset:
-            raise LookupError("Acquisition data not found in the dataset.")
-        return self._dataset['waveforms'].size
+        return _length(self._require('waveforms', "Acquisition data not found in the dataset."))
 
+    @instrumented('read_waveform')
     def read_waveform(self, wavnum):
-        if 'waveforms' not in self._dataset:
-            raise LookupError("Acquisition data not found in the dataset.")
+        dset = self._require('waveforms', "Acquisition data not found in the dataset.")
 
-        # create a Waveform
-        # and fill with the header for this waveform
-        # HDF5 does not guarantee data alignment, so we must copy into a numpy array. *sigh*
-        # We start with an array of zeros to avoid garbage in the padding bytes.
-        header_array = np.zeros((1, ), dtype=waveform_header_dtype)
-        header_array[0] = self._dataset['waveforms'][wavnum]['head']
+        # read the whole record once and build the waveform from it
+        wavnum = _index(wavnum, _length(dset))
+        return _waveforms_from_numpy(dset[wavnum:wavnum + 1])[0]
 
-        wav = ismrmrd.Waveform(header_array)
+    @instrumented('read_waveform')
+    def read_waveforms(self, selection=None):
+        """Read a selection of waveforms with a single HDF5 read.
 
-        # copy the data as uint32
-        wav.data[:] = self._dataset['waveforms'][wavnum]['data'].view(np.uint32).reshape((wav.channels, wav.number_of_samples))[:]
+        Parameters
+        ----------
+        selection : slice, array of int or array of bool, optional
+            Rows to read, as for :meth:`read_acquisitions`. When omitted, all
+            waveforms are read.
 
-        return wav
+        Returns
+        -------
+        list of :class:`ismrmrd.Waveform`
+        """
+        dset = self._require('waveforms', "Acquisition data not found in the dataset.")
+        return _waveforms_from_numpy(_read_selection(dset, selection))
 
-    def append_waveform(self, wav):
-        # create the dataset if needed
-        self._file.require_group(self._dataset_name)
+    @instrumented('read_waveform')
+    def waveforms_by_id(self, waveform_id, tick_us):
+        """Concatenate the samples of every waveform of one type.
 
-        if 'waveforms' in self._dataset:
-            wavnum = self._dataset['waveforms'].shape[0]
-            self._dataset['waveforms'].resize(wavnum+1, axis=0)
-        else:
-            self._dataset.create_dataset("waveforms", (1,), maxshape=(None,), dtype=waveform_dtype)
-            wavnum = 0
+        Only the headers of all waveforms and the data of the matching ones
+        are read. Waveforms are concatenated in the order they were appended.
 
-        np.frombuffer(wav.getHead(), dtype=waveform_header_dtype)
+        Parameters
+        ----------
+        waveform_id : int
+            Waveform type, e.g. ECG or respiratory.
+        tick_us : float
+            Duration in microseconds of one unit of the waveform header's
+            ``time_stamp``. It depends on the scanner vendor, e.g. 2500.0 for
+            files converted from Siemens data.
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            ``(channels, samples)`` uint32 array.
+        time_stamps : numpy.ndarray
+            Time of every sample in microseconds: the ``time_stamp`` of its
+            waveform plus its offset in the waveform, from ``sample_time_us``.
+        """
+        dset = self._require('waveforms', "Acquisition data not found in the dataset.")
 
-        # create an empty hdf5 acquisition and fill it
-        h5wav = np.empty((1,),dtype=waveform_dtype)
-        # copy the header
+        heads = _read_selection(dset, None, 'head')
+        rows = np.flatnonzero(heads['waveform_id'] == waveform_id)
+        heads = heads[rows]
 
-        h5wav[0]['head'] = np.frombuffer(wav.getHead(), dtype=waveform_header_dtype)
+        channels = np.unique(heads['channels'])
+        if channels.size > 1:
+            raise ValueError("Waveforms differ in their number of channels.")
+        if rows.size == 0:
+            return np.empty((0, 0), dtype=np.uint32), np.empty(0)
 
-        # copy the data as float
-        h5wav[0]['data'] = wav.data.view(np.uint32).reshape(( wav.channels * wav.number_of_samples,))
+        data = _read_selection(dset, rows, 'data')
+        samples = np.concatenate([d.reshape((channels[0], -1)) for d in data], axis=1)
+
+        nsamples = heads['number_of_samples'].astype(np.intp)
+        first = np.repeat(np.cumsum(nsamples) - nsamples, nsamples)
+        offsets = np.arange(first.size) - first
+        time_stamps = (np.repeat(heads['time_stamp'] * tick_us, nsamples) +
+                       offsets * np.repeat(heads['sample_time_us'].astype(np.float64), nsamples))
+
+        return samples, time_stamps
+
+    @instrumented('append_waveform', 0)
+    def append_waveform(self, wav, storage=None):
+        self.append_waveforms([wav], storage=storage)
+
+    @instrumented('append_waveform', 0)
+    def append_waveforms(self, waveforms, storage=None):
+        """Append a batch of waveforms with a single resize and write.
+
+        Parameters
+        ----------
+        waveforms : iterable of :class:`ismrmrd.Waveform`
+            Waveforms to append, in order.
+        storage : dict, optional
+            Storage options used if the waveform dataset has to be created.
+        """
+        waveforms = list(waveforms)
+        if not waveforms:
+            return
+
+        if self._writer is not None:
+            self._writer.put('waveforms', _waveforms_to_numpy(waveforms, copy=True), storage)
+        else:
+            self._append_waveforms(waveforms, storage)
+
+    def _append_waveforms(self, waveforms, storage):
+        # waveforms is a list of Waveform, or the records packed by
+        # _waveforms_to_numpy that the background writer is given.
+        self._swmr_append()
+
+        buffer = waveforms if isinstance(waveforms, np.ndarray) else _waveforms_to_numpy(waveforms)
+
+        # extend by the size of the batch, creating the dataset if needed
+        dset = self._lookup('waveforms')
+        if dset is not None:
+            wavnum = self._reserve('waveforms', buffer.size)
+        else:
+            dset = self._create('waveforms', (buffer.size,), (None,), waveform_dtype, storage)
+            wavnum = 0
 
         # put it into the hdf5 file
-        self._dataset['waveforms'][wavnum] = h5wav[0]
+        dset[wavnum:wavnum + buffer.size] = buffer
+
+        if self._swmr:
+            dset.flush()
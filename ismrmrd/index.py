@@ -0,0 +1,79 @@
+import numpy as np
+
+
+class EncodingIndex:
+    """An index of acquisitions by their encoding counters.
+
+    The index holds the ``idx`` member of every acquisition header, as a
+    structured array of ``encoding_counters_dtype``, and maps values of any
+    subset of the :class:`EncodingCounters` fields to the rows of the
+    acquisitions that carry them. The rows of every combination of values are
+    grouped in one vectorized pass the first time a set of fields is
+    queried, after which each lookup is a dictionary access.
+
+    The ``user`` field is queried with a sequence of all eight user counters.
+    """
+
+    def __init__(self, counters):
+        self.counters = counters
+        self._groups = {}
+
+    @property
+    def fields(self):
+        return self.counters.dtype.names
+
+    def __len__(self):
+        return self.counters.size
+
+    def __repr__(self):
+        return f"{type(self).__name__} over {len(self)} acquisitions"
+
+    def extend(self, counters):
+        self.counters = np.concatenate([self.counters, counters])
+        self._groups.clear()
+
+    def _fields(self, names):
+        unknown = set(names) - set(self.fields)
+        if unknown:
+            raise TypeError("Unknown encoding counters: " + ", ".join(sorted(unknown)))
+        return tuple(name for name in self.fields if name in names)
+
+    def groups(self, *fields):
+        """Map each combination of values of *fields* to an array of rows.
+
+        Keys are tuples of the values of *fields*, in the order of the
+        ``EncodingCounters`` structure; the eight ``user`` counters are
+        flattened into the tuple. Rows are in ascending order.
+        """
+        fields = self._fields(fields)
+
+        groups = self._groups.get(fields)
+        if groups is None:
+            columns = np.concatenate([self.counters[name].reshape((len(self), -1)) for name in fields], axis=1)
+            keys, inverse = np.unique(columns, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+
+            order = np.argsort(inverse, kind='stable')
+            bounds = np.cumsum(np.bincount(inverse, minlength=len(keys)))[:-1]
+
+            groups = self._groups[fields] = dict(zip(map(tuple, keys.tolist()), np.split(order, bounds)))
+
+        return groups
+
+    def rows(self, **counters):
+        """Rows of the acquisitions whose encoding counters have the given values.
+
+        For example, ``index.rows(slice=3, repetition=7)``. Without any
+        counters, all rows are returned.
+        """
+        if not counters:
+            return np.arange(len(self))
+
+        fields = self._fields(counters)
+
+        key = []
+        for name in fields:
+            value = counters[name]
+            key.extend(value if name == 'user' else [value])
+
+        return self.groups(*fields).get(tuple(int(v) for v in key), np.empty(0, dtype=np.intp))
@@ -0,0 +1,223 @@
+import array
+import contextlib
+import ctypes
+import functools
+import inspect
+import threading
+import time
+from collections.abc import Iterator
+
+import numpy as np
+
+from .batch import AcquisitionBatch
+
+
+def _nbytes(value):
+    # Bytes of the ISMRMRD objects read or written by an operation.
+    if value is None:
+        return 0
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(item) for item in value)
+    if isinstance(value, AcquisitionBatch):
+        return value.headers.nbytes + _nbytes(value.data) + _nbytes(value.traj)
+
+    head = getattr(value, '_head', None)
+    if head is None:
+        return 0
+    return (ctypes.sizeof(head) + _nbytes(getattr(value, 'data', None)) +
+            _nbytes(getattr(value, 'traj', None)) + _nbytes(getattr(value, 'attribute_string', None)))
+
+
+class IOStats:
+    """Call counts, bytes moved and wall times of I/O operations.
+
+    Operations are named after what they move, e.g. ``'read_acquisition'``,
+    ``'append_image'`` or ``'write_header'``. Every call is recorded once,
+    also when it is implemented with other instrumented calls. Batch calls,
+    such as :meth:`ismrmrd.Dataset.append_acquisitions`, count as one call
+    moving the bytes of the whole batch; iterating a container records one
+    call per item.
+
+    *callback*, when given, is called as ``callback(operation, nbytes,
+    seconds)`` after every recorded call, e.g. to forward the numbers to a
+    metrics system.
+    """
+
+    def __init__(self, callback=None, parent=None):
+        self.callback = callback
+        self._parent = parent
+        self._counts = {}
+        self._bytes = {}
+        self._times = {}
+        self._lock = threading.Lock()
+        self._calls = threading.local()
+
+    def _enter(self):
+        # Returns False inside another recorded call on the same thread.
+        depth = getattr(self._calls, 'depth', 0)
+        self._calls.depth = depth + 1
+        return depth == 0
+
+    def _exit(self):
+        self._calls.depth -= 1
+
+    def record(self, operation, nbytes, seconds):
+        with self._lock:
+            if operation not in self._times:
+                self._counts[operation] = 0
+                self._bytes[operation] = 0
+                self._times[operation] = array.array('d')
+
+            self._counts[operation] += 1
+            self._bytes[operation] += nbytes
+            self._times[operation].append(seconds)
+
+        if self.callback is not None:
+            self.callback(operation, nbytes, seconds)
+        if self._parent is not None:
+            self._parent.record(operation, nbytes, seconds)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+            self._bytes.clear()
+            self._times.clear()
+
+    def summary(self):
+        """Return a dictionary of statistics per operation.
+
+        Each entry holds the call ``count``, the ``bytes`` moved, the total
+        ``time`` in seconds and the ``mean``, ``p50``, ``p90``, ``p99`` and
+        ``max`` time per call.
+        """
+        with self._lock:
+            times = {operation: np.array(times) for operation, times in self._times.items()}
+
+        summary = {}
+        for operation, times in times.items():
+            p50, p90, p99 = np.percentile(times, [50, 90, 99])
+            summary[operation] = {
+                'count': self._counts[operation],
+                'bytes': self._bytes[operation],
+                'time': float(times.sum()),
+                'mean': float(times.mean()),
+                'p50': float(p50),
+                'p90': float(p90),
+                'p99': float(p99),
+                'max': float(times.max()),
+            }
+        return summary
+
+    def __repr__(self):
+        return f"{type(self).__name__} over {sum(self._counts.values())} calls"
+
+
+class Instrumentation:
+    # Shared by a Dataset or File and every object reading or writing through
+    # it; `stats` is None while instrumentation is disabled.
+
+    def __init__(self):
+        self.stats = None
+
+    def enable(self, callback=None):
+        self.stats = IOStats(callback)
+        return self.stats
+
+    def disable(self):
+        self.stats = None
+
+    def summary(self):
+        return {} if self.stats is None else self.stats.summary()
+
+    @contextlib.contextmanager
+    def scope(self, callback=None):
+        previous = self.stats
+        self.stats = IOStats(callback, parent=previous)
+        try:
+            yield self.stats
+        finally:
+            self.stats = previous
+
+
+# Used by objects created without a Dataset or File, which are never instrumented.
+disabled = Instrumentation()
+
+
+def _counted(items, total):
+    # Pass items through, adding up their bytes in total[0] as they are consumed.
+    for item in items:
+        total[0] += _nbytes(item)
+        yield item
+
+
+def instrumented(operation, argument=None):
+    """Record calls of a method as *operation* while instrumentation is enabled.
+
+    The bytes moved are those of positional argument *argument*, or of the
+    return value when it is None; iterators are counted as the method
+    consumes them. ``{}`` in *operation* is replaced by the ``_item``
+    attribute of the method's object, which must also have an
+    ``_instrumentation`` attribute. When disabled, the only overhead is one
+    attribute lookup per call.
+    """
+    def decorate(method):
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def generator(self, *args, **kwargs):
+                stats = self._instrumentation.stats
+                if stats is None:
+                    yield from method(self, *args, **kwargs)
+                    return
+
+                name = operation.format(getattr(self, '_item', None))
+                items = method(self, *args, **kwargs)
+                while True:
+                    outermost = stats._enter()
+                    start = time.perf_counter()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    finally:
+                        stats._exit()
+                    if outermost:
+                        stats.record(name, _nbytes(item), time.perf_counter() - start)
+                    yield item
+
+            return generator
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self._instrumentation.stats
+            if stats is None:
+                return method(self, *args, **kwargs)
+
+            measured = argument is not None and argument < len(args)
+            total = None
+            if measured and isinstance(args[argument], Iterator):
+                total = [0]
+                args = args[:argument] + (_counted(args[argument], total),) + args[argument + 1:]
+
+            outermost = stats._enter()
+            start = time.perf_counter()
+            try:
+                result = method(self, *args, **kwargs)
+            finally:
+                stats._exit()
+            elapsed = time.perf_counter() - start
+
+            if outermost:
+                if total is not None:
+                    nbytes = total[0]
+                else:
+                    nbytes = _nbytes(args[argument] if measured else result)
+                stats.record(operation.format(getattr(self, '_item', None)), nbytes, elapsed)
+            return result
+
+        return wrapper
+
+    return decorate
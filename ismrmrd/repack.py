@@ -0,0 +1,206 @@
+"""Rewrite ISMRMRD HDF5 files with compact storage.
+
+Files written by many single-row appends end up with small chunks, no
+compression and fragmented heap storage. :func:`repack` copies every group,
+dataset and attribute into a fresh file, block by block, with chunks sized
+for bulk reads and the requested filters. It is also available on the
+command line::
+
+    python -m ismrmrd.repack input.h5 output.h5
+"""
+import argparse
+import os
+import time
+
+import h5py
+import numpy as np
+
+from .file import File
+from .hdf5 import _create_dataset, _length, length_attribute
+
+default_storage = {'compression': 'gzip', 'compression_opts': 4, 'shuffle': True}
+
+
+def _nbytes(value):
+    # Size of a row read from a dataset, including variable-length payloads.
+    if isinstance(value, np.void) and value.dtype.names:
+        return sum(_nbytes(value[name]) for name in value.dtype.names)
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return np.asarray(value).nbytes
+
+
+def _copy_attributes(source, destination):
+    for name in source.attrs:
+        if name != length_attribute:
+            destination.attrs.create(name, source.attrs[name], dtype=source.attrs.get_id(name).dtype)
+
+
+def _copy_dataset(source, group, name, storage, chunk_bytes, block_bytes):
+    length = _length(source) if source.shape else 0
+    resizable = bool(source.shape) and source.maxshape[0] is None
+
+    if not source.shape or (length == 0 and not resizable):
+        destination = group.create_dataset(name, data=source[()], dtype=source.dtype)
+        _copy_attributes(source, destination)
+        return
+
+    # Chunks of variable-length data hold only references to the heap, while
+    # reading a block also reads the payloads.
+    chunk_row_nbytes = source.dtype.itemsize * int(np.prod(source.shape[1:]))
+    row_nbytes = max(_nbytes(source[0]), 1) if length else chunk_row_nbytes
+
+    storage = dict(storage)
+    if storage.get('chunks') is None:
+        storage['chunks'] = max(1, min(chunk_bytes // chunk_row_nbytes, length or 1))
+        if not resizable:
+            storage['chunks'] = min(storage['chunks'], source.shape[0])
+
+    shape = (length,) + source.shape[1:]
+    maxshape = ((None,) if resizable else (length,)) + source.maxshape[1:]
+    destination = _create_dataset(group, name, shape, maxshape, source.dtype, storage)
+
+    rows = max(1, block_bytes // row_nbytes)
+    for start in range(0, length, rows):
+        block = slice(start, min(start + rows, length))
+        destination[block] = source[block]
+
+    _copy_attributes(source, destination)
+
+
+def _copy_group(source, destination, storage, chunk_bytes, block_bytes):
+    _copy_attributes(source, destination)
+
+    for name, item in source.items():
+        if isinstance(item, h5py.Group):
+            _copy_group(item, destination.create_group(name), storage, chunk_bytes, block_bytes)
+        elif isinstance(item, h5py.Dataset):
+            _copy_dataset(item, destination, name, storage, chunk_bytes, block_bytes)
+
+
+def _read_everything(filename, block_size=256):
+    # Read every acquisition, waveform and image in the file through
+    # ismrmrd.File; returns the number of items read and the time it took.
+    count = 0
+    start = time.perf_counter()
+
+    with File(filename, 'r') as file:
+        for path in sorted(file.find_data()):
+            container = file[path]
+            for items in (container.acquisitions, container.waveforms):
+                for first in range(0, len(items) if items is not None else 0, block_size):
+                    count += len(items[first:first + block_size])
+
+        for path in sorted(file.find_images()):
+            images = file[path].images
+            for first in range(0, len(images), block_size):
+                count += len(images[first:first + block_size])
+
+    return count, time.perf_counter() - start
+
+
+def repack(source, destination, storage=None, chunk_bytes=1 << 20, block_bytes=64 << 20,
+           overwrite=False, measure=True):
+    """Copy an ISMRMRD HDF5 file into a fresh, compactly stored file.
+
+    Every group, dataset and attribute is copied with its type and contents
+    unchanged; datasets over-allocated by :class:`ismrmrd.Dataset` are
+    trimmed to the rows in use. Datasets are copied *block_bytes* at a time,
+    so files larger than memory can be repacked.
+
+    Parameters
+    ----------
+    source, destination : str
+        Paths of the file to repack and of the file to create.
+    storage : dict, optional
+        Storage options for the new datasets; see :class:`ismrmrd.Dataset`.
+        Defaults to gzip level 4 with shuffle. Unless ``'chunks'`` is given,
+        chunks hold about *chunk_bytes* of rows each. Variable-length
+        acquisition and waveform payloads are rewritten contiguously but are
+        not compressed by HDF5 filters.
+    chunk_bytes : int, optional
+        Target size of a chunk.
+    block_bytes : int, optional
+        Approximate amount of data copied per read and write.
+    overwrite : bool, optional
+        Replace *destination* if it exists.
+    measure : bool, optional
+        Time reading every acquisition, waveform and image of both files
+        through :class:`ismrmrd.File`.
+
+    Returns
+    -------
+    dict
+        ``source_size`` and ``destination_size`` in bytes, the ``elapsed``
+        time of the copy and, when *measure* is set, the number of
+        ``items`` read and the ``source_read_time`` and
+        ``destination_read_time`` in seconds.
+    """
+    if os.path.abspath(source) == os.path.abspath(destination):
+        raise ValueError("Cannot repack a file onto itself.")
+    if storage is None:
+        storage = default_storage
+
+    start = time.perf_counter()
+    with h5py.File(source, 'r') as src, h5py.File(destination, 'w' if overwrite else 'w-') as dst:
+        _copy_group(src, dst, storage, chunk_bytes, block_bytes)
+    elapsed = time.perf_counter() - start
+
+    report = {
+        'source_size': os.path.getsize(source),
+        'destination_size': os.path.getsize(destination),
+        'elapsed': elapsed,
+    }
+
+    if measure:
+        report['items'], report['source_read_time'] = _read_everything(source)
+        _, report['destination_read_time'] = _read_everything(destination)
+
+    return report
+
+
+def _print_report(report):
+    mib = 1024 ** 2
+
+    def throughput(size, seconds):
+        return size / mib / seconds if seconds else float('inf')
+
+    print(f"repacked in {report['elapsed']:.2f} s")
+    print(f"size:   {report['source_size'] / mib:10.2f} MiB -> {report['destination_size'] / mib:10.2f} MiB "
+          f"({100 * report['destination_size'] / max(report['source_size'], 1):.1f}%)")
+
+    if 'items' in report:
+        for label, size, seconds in [('before', report['source_size'], report['source_read_time']),
+                                     ('after', report['destination_size'], report['destination_read_time'])]:
+            rate = report['items'] / seconds if seconds else float('inf')
+            print(f"read {label + ':':<7} {seconds:8.3f} s  {rate:12.1f} items/s  "
+                  f"{throughput(size, seconds):10.1f} MiB/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m ismrmrd.repack',
+                                     description="Rewrite an ISMRMRD HDF5 file with compact, compressed storage.")
+    parser.add_argument('source', help="File to repack")
+    parser.add_argument('destination', help="File to create")
+    parser.add_argument('--compression', default='gzip', choices=['gzip', 'lzf', 'none'])
+    parser.add_argument('--level', type=int, default=4, help="gzip compression level")
+    parser.add_argument('--no-shuffle', action='store_true', help="Do not apply the shuffle filter")
+    parser.add_argument('--fletcher32', action='store_true', help="Add checksums to the datasets")
+    parser.add_argument('--chunk-bytes', type=int, default=1 << 20, help="Target chunk size in bytes")
+    parser.add_argument('--no-measure', action='store_true', help="Do not time reading the files")
+    parser.add_argument('-f', '--force', action='store_true', help="Overwrite the destination")
+    args = parser.parse_args(argv)
+
+    storage = {'shuffle': not args.no_shuffle, 'fletcher32': args.fletcher32}
+    if args.compression != 'none':
+        storage['compression'] = args.compression
+    if args.compression == 'gzip':
+        storage['compression_opts'] = args.level
+
+    report = repack(args.source, args.destination, storage, chunk_bytes=args.chunk_bytes,
+                    overwrite=args.force, measure=not args.no_measure)
+    _print_report(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,15 @@
 import ismrmrd
+import h5py
 import shutil
 import os.path
 import tempfile
 import numpy
 import pytest
+import io
+import copy
+import pickle
+import itertools
+import tracemalloc
 from test_common import *
 
 @pytest.fixture(autouse=True)
@@ -79,6 +85,134 @@ def test_file_can_access_random_acquisition_slice():
         for a, b in zip(acquisitions[250:255], dataset.acquisitions[250:255]):
             assert a == b
 
+def test_file_can_access_acquisitions_by_index_array():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(12))
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        dataset.acquisitions = acquisitions
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        assert dataset.acquisitions[[7, 2, 2, -1]] == [acquisitions[i] for i in [7, 2, 2, -1]]
+        mask = numpy.arange(12) % 3 == 0
+        assert dataset.acquisitions[mask] == acquisitions[::3]
+        assert dataset.acquisitions[10:4:-2] == acquisitions[10:4:-2]
+
+def test_file_can_read_acquisitions_as_batch():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(12))
+    odd = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            file['dataset'].acquisitions = acquisitions
+        with ismrmrd.File(filename) as file:
+            read_acquisitions = file['dataset'].acquisitions
+
+            batch = read_acquisitions.batch[2:8]
+            assert isinstance(batch, ismrmrd.AcquisitionBatch)
+            assert not batch.is_ragged
+            assert batch.data.shape == (6, 32, 256)
+            assert batch.traj.shape == (6, 256, 2)
+            assert list(batch.headers['scan_counter']) == [a.scan_counter for a in acquisitions[2:8]]
+            assert batch.to_acquisitions() == acquisitions[2:8]
+
+            batch = read_acquisitions.batch[[9, 0, 9]]
+            assert numpy.array_equal(batch.data[1], acquisitions[0].data)
+            assert list(batch) == [acquisitions[9], acquisitions[0], acquisitions[9]]
+
+            read_acquisitions.append(odd)
+            batch = file['dataset'].acquisitions.batch[numpy.arange(13) >= 10]
+            assert batch.is_ragged
+            assert list(batch) == acquisitions[10:] + [odd]
+
+def test_file_iterates_lazy_acquisitions():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(10))
+    for i, acquisition in enumerate(acquisitions):
+        acquisition.idx.kspace_encode_step_1 = i
+        acquisition.clear_all_flags()
+    acquisitions[3].set_flag(ismrmrd.ACQ_IS_NOISE_MEASUREMENT)
+
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            file['dataset'].acquisitions = acquisitions
+        with ismrmrd.File(filename, instrument=True) as file:
+            proxies = list(file['dataset'].acquisitions.lazy(block_size=4))
+            assert [p.idx.kspace_encode_step_1 for p in proxies] == list(range(10))
+            assert [p.is_flag_set(ismrmrd.ACQ_IS_NOISE_MEASUREMENT) for p in proxies] == [i == 3 for i in range(10)]
+            assert all(isinstance(p, ismrmrd.Acquisition) for p in proxies)
+
+            stats = file.stats()
+            assert stats['read_acquisition_header']['count'] == 3
+            assert 'read_acquisition' not in stats
+
+            assert numpy.array_equal(proxies[2].data, acquisitions[2].data)
+            assert proxies[5] == acquisitions[5]
+            assert proxies[7].traj.shape == acquisitions[7].traj.shape
+            assert file.stats()['read_acquisition']['count'] == 3
+
+            proxies[8].resize(4, 2)
+            assert proxies[8].data.shape == (2, 4)
+            assert ismrmrd.Acquisition.from_bytes(proxies[6].to_bytes()) == acquisitions[6]
+            assert file.stats()['read_acquisition']['count'] == 5
+
+def test_file_lazy_acquisitions_copy_pickle_and_close():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(4))
+
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            file['dataset'].acquisitions = acquisitions
+        with ismrmrd.File(filename) as file:
+            proxies = list(file['dataset'].acquisitions.lazy())
+
+            copied = copy.deepcopy(proxies[0])
+            assert type(copied) is ismrmrd.Acquisition
+            assert copied == acquisitions[0]
+            copied.idx.kspace_encode_step_1 += 1
+            copied.data[:] = 0
+            assert proxies[0] == acquisitions[0]
+
+            pickled = pickle.loads(pickle.dumps(proxies[1]))
+            assert type(pickled) is ismrmrd.Acquisition
+            assert pickled == acquisitions[1]
+            assert proxies[2].data is not None
+
+        assert pickle.loads(pickle.dumps(proxies[2])) == acquisitions[2]
+        assert proxies[3].idx.kspace_encode_step_1 == acquisitions[3].idx.kspace_encode_step_1
+        with pytest.raises(ValueError, match='closed'):
+            proxies[3].data
+
+
+def test_file_lazy_acquisitions_raise_read_errors_while_open():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisition = ismrmrd.Acquisition.from_array(create_random_data((2, 4)))
+
+    with ismrmrd.File(filename, 'w') as file:
+        file['dataset'].acquisitions = [acquisition]
+        records = file['dataset'].acquisitions.data
+        record = records[0]
+        record['head']['number_of_samples'] = 9
+        records[0] = record
+
+    with ismrmrd.File(filename) as file:
+        proxy = next(iter(file['dataset'].acquisitions.lazy()))
+        with pytest.raises(ValueError, match='reshape'):
+            proxy.data
+
+def test_file_can_read_acquisition_headers():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(32))
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        dataset.acquisitions = acquisitions
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        headers = dataset.acquisitions.headers(slice(10, 20))
+        assert headers.dtype == ismrmrd.hdf5.acquisition_header_dtype
+        for a, header in zip(acquisitions[10:20], headers):
+            assert a.getHead() == ismrmrd.AcquisitionHeader.from_buffer_copy(header)
+
 def test_file_can_write_random_acquisition():
     filename = os.path.join(temp_dir, "acquisitions.h5")
     acquisitions = list(random_acquisitions(256))
@@ -130,6 +264,125 @@ def test_file_cannot_write_mismatched_slice():
             dataset.acquisitions = acquisitions
             dataset.acquisitions[150:155] = slice
 
+def test_file_respects_logical_length_of_appended_datasets():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(5))
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        dataset.acquisitions = acquisitions
+    with h5py.File(filename, 'a') as file:
+        file['dataset/data'].resize(8, axis=0)
+        file['dataset/data'].attrs['ismrmrd_length'] = 5
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        assert len(dataset.acquisitions) == 5
+        assert list(dataset.acquisitions) == acquisitions
+        assert dataset.acquisitions[-1] == acquisitions[-1]
+        assert dataset.acquisitions[3:] == acquisitions[3:]
+        dataset.acquisitions.append(acquisitions[0])
+    with h5py.File(filename, 'r') as file:
+        assert file['dataset/data'].shape == (6,)
+        assert 'ismrmrd_length' not in file['dataset/data'].attrs
+
+def test_file_can_read_and_write_dense_acquisitions():
+    filename = os.path.join(temp_dir, "dense.h5")
+    acquisitions = list(random_acquisitions(10))
+    with ismrmrd.File(filename, layout='dense') as file:
+        dataset = file['dataset']
+        dataset.acquisitions = acquisitions
+        dataset.acquisitions.extend(acquisitions[:2])
+        dataset.acquisitions[3] = acquisitions[0]
+    expected = acquisitions + acquisitions[:2]
+    expected[3] = acquisitions[0]
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        assert 'dense_data' in dataset.keys()
+        assert file.find_data() == {'dataset'}
+        assert len(dataset.acquisitions) == len(expected)
+        assert list(dataset.acquisitions) == expected
+        assert dataset.acquisitions[2:5] == expected[2:5]
+        assert list(dataset.acquisitions.headers()['scan_counter']) == [a.scan_counter for a in expected]
+
+def test_file_dense_acquisitions_fall_back_to_vlen():
+    filename = os.path.join(temp_dir, "dense.h5")
+    acquisitions = list(random_acquisitions(4))
+    odd = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+    with ismrmrd.File(filename, layout='dense') as file:
+        dataset = file['dataset']
+        dataset.acquisitions = acquisitions
+        dataset.acquisitions.append(odd)
+    with ismrmrd.File(filename) as file:
+        dataset = file['dataset']
+        assert 'dense_data' not in dataset.keys()
+        assert list(dataset.acquisitions) == acquisitions + [odd]
+
+def test_file_streams_assigned_acquisitions_and_waveforms():
+    filename = os.path.join(temp_dir, "streamed.h5")
+
+    def acquisitions(n):
+        for i in range(n):
+            acquisition = ismrmrd.Acquisition.from_array(numpy.full((8, 128), i, dtype=numpy.complex64))
+            acquisition.scan_counter = i
+            yield acquisition
+
+    def waveforms(n):
+        for i in range(n):
+            yield ismrmrd.Waveform.from_array(numpy.full((4, 512), i, dtype=numpy.uint32))
+
+    def peak_memory(write):
+        tracemalloc.start()
+        try:
+            write()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    with ismrmrd.File(filename, 'w') as file:
+        for layout in ['vlen', 'dense']:
+            dataset = file[layout]
+            dataset.layout = layout
+
+            def assign(n):
+                dataset.acquisitions = acquisitions(n)
+                dataset.acquisitions.extend(acquisitions(n))
+                dataset.waveforms = waveforms(n)
+
+            short, long = peak_memory(lambda: assign(500)), peak_memory(lambda: assign(2000))
+            written = 2000 * (2 * 8 * 128 * 8 + 4 * 512 * 4)
+            assert long < 1.5 * short
+            assert long < written / 4
+
+            assert len(dataset.acquisitions) == len(dataset.waveforms) * 2 == 4000
+            assert dataset.acquisitions[2500].scan_counter == 500
+            assert ('dense_data' in dataset.keys()) == (layout == 'dense')
+            assert numpy.all(dataset.waveforms[-1].data == 1999)
+
+def test_file_assignment_can_read_replaced_acquisitions():
+    filename = os.path.join(temp_dir, "acquisitions.h5")
+    acquisitions = list(random_acquisitions(10))
+    odd = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            dataset = file['dataset']
+            dataset.acquisitions = acquisitions
+            dataset.acquisitions = (a for a in dataset.acquisitions if a.scan_counter % 2)
+            expected = [a for a in acquisitions if a.scan_counter % 2]
+            assert list(dataset.acquisitions) == expected
+
+            def failing():
+                yield acquisitions[0]
+                raise RuntimeError("source failed")
+
+            with pytest.raises(RuntimeError):
+                dataset.acquisitions = failing()
+            assert list(dataset.acquisitions) == expected
+            assert dataset.keys() == file['dataset'].keys()
+            assert 'ismrmrd_staging' not in dataset.keys()
+
+            dataset.acquisitions.extend(itertools.chain(acquisitions[:3], [odd], acquisitions[3:]))
+            assert 'dense_head' not in dataset.keys()
+            assert list(dataset.acquisitions) == expected + acquisitions[:3] + [odd] + acquisitions[3:]
+
 def test_file_can_read_and_write_waveforms():
     filename = os.path.join(temp_dir, "waveforms.h5")
     waveforms = list(random_waveforms(10))
@@ -168,6 +421,36 @@ def test_file_can_read_and_write_images():
         for a, b in zip(images, imageset.images):
             assert a == b
 
+def test_file_can_append_images():
+    filename = os.path.join(temp_dir, "images.h5")
+    images = list(random_images(40))
+    with ismrmrd.File(filename) as file:
+        imageset = file['dataset/image_1']
+        imageset.images = images[:1]
+        for image in images[1:5]:
+            imageset.images.append(image)
+        imageset.images.extend(image for image in images[5:])
+
+        odd = ismrmrd.Image.from_array(numpy.zeros((16, 16), dtype=numpy.float32))
+        with pytest.raises(TypeError):
+            imageset.images.append(odd)
+        with pytest.raises(TypeError):
+            imageset.images.append(ismrmrd.Image.from_array(images[0].data.astype(numpy.complex64)))
+        assert len(imageset.images) == len(images)
+
+        with pytest.raises(ValueError):
+            file['dataset/image_2'].images = []
+
+    with h5py.File(filename, 'r') as file:
+        data = file['dataset/image_1/data']
+        assert data.maxshape == (None,) + data.shape[1:]
+        assert data.chunks == (1,) + data.shape[1:]
+        assert file['dataset/image_1/header'].maxshape[0] is None
+        assert 'ismrmrd_staging' not in file['dataset']
+
+    with ismrmrd.File(filename) as file:
+        assert list(file['dataset/image_1'].images) == images
+
 def test_file_can_read_random_image():
     filename = os.path.join(temp_dir, "images.h5")
     images = list(random_images(10))
@@ -178,6 +461,33 @@ def test_file_can_read_random_image():
         imageset = file['dataset/image_1']
         assert images[8] == imageset.images[8]
 
+def test_file_reads_image_data_without_copies():
+    filename = os.path.join(temp_dir, "images.h5")
+    images = list(random_images(6))
+    complex_images = [ismrmrd.Image.from_array(create_random_data((2, 4, 8))) for _ in range(3)]
+    with ismrmrd.File(filename) as file:
+        file['dataset/image_1'].images = images
+        file['dataset/image_2'].images = complex_images
+    with ismrmrd.File(filename) as file:
+        imageset = file['dataset/image_1'].images
+
+        read_images = imageset[1:4]
+        assert read_images == images[1:4]
+        assert read_images[0].data.base is read_images[2].data.base
+
+        out = numpy.empty((3,) + images[0].data.shape, dtype=images[0].data.dtype)
+        assert imageset.read_data(slice(0, 6, 2), out=out) is out
+        assert numpy.array_equal(out, numpy.stack([image.data for image in images[::2]]))
+        assert numpy.array_equal(imageset.read_data(-1)[0], images[-1].data)
+        with pytest.raises(ValueError):
+            imageset.read_data(slice(0, 2), out=out)
+        with pytest.raises(ValueError):
+            imageset.read_data(slice(0, 3), out=out.astype(numpy.float64))
+
+        read_complex = file['dataset/image_2'].images
+        assert list(read_complex) == complex_images
+        assert read_complex.read_data().dtype == numpy.complex64
+
 def test_file_can_write_random_image():
     filename = os.path.join(temp_dir, "images.h5")
     image = create_random_image()
@@ -212,6 +522,26 @@ def test_file_can_write_image_slice():
         for a, b in zip(images, imageset.images[5:15]):
             assert a == b
 
+def test_file_applies_storage_options():
+    filename = os.path.join(temp_dir, "storage.h5")
+    with ismrmrd.File(filename, storage={'chunks': 8, 'compression': 'gzip'}) as file:
+        dataset = file['dataset']
+        dataset.acquisitions = random_acquisitions(10)
+        imageset = file['dataset/image_1']
+        imageset.storage = {'compression': 'lzf', 'shuffle': True}
+        imageset.images = random_images(3)
+    with h5py.File(filename, 'r') as file:
+        assert file['dataset/data'].chunks == (8,)
+        assert file['dataset/data'].compression == 'gzip'
+        for key in ['data', 'header', 'attributes']:
+            assert file['dataset/image_1'][key].chunks is not None
+            assert file['dataset/image_1'][key].compression == 'lzf'
+            assert file['dataset/image_1'][key].maxshape[0] is None
+    with ismrmrd.File(filename) as file:
+        imageset = file['dataset/image_1']
+        for a, b in zip(random_images(3), imageset.images):
+            assert a == b
+
 def test_file_can_list_contained_images():
     filename = os.path.join(temp_dir, "find_file.h5")
     with ismrmrd.File(filename) as file:
@@ -227,6 +557,36 @@ def test_file_can_list_contained_images():
         assert(file.find_images() == {'dataset/image_1', 'dataset/image_2', 'dataset/nested/image_3'})
         assert(file.find_data() == {'dataset'})
 
+def test_file_caches_found_groups_until_written(monkeypatch):
+    filename = os.path.join(temp_dir, "find_file.h5")
+    with ismrmrd.File(filename) as file:
+        for i in range(20):
+            file[f'archive/scan_{i}/raw'].acquisitions = random_acquisitions(1)
+            file[f'archive/scan_{i}/recon/images'].images = random_images(1)
+        file['archive/scan_3/raw'].waveforms = random_waveforms(1)
+        file['archive/scan_5/physio'].waveforms = random_waveforms(1)
+        file['archive/empty/group']
+
+        passes = []
+        classify = ismrmrd.file._classify
+        monkeypatch.setattr(ismrmrd.file, '_classify', lambda group: passes.append(group.name) or classify(group))
+
+        found = set()
+        file.visit(lambda node, path: found.add(path) if node.has_data() else None)
+        assert file.find_data() == found
+        assert file.find_images() == {f'archive/scan_{i}/recon/images' for i in range(20)}
+        assert file['archive'].find_data() == {path[len('archive/'):] for path in found}
+        assert file.find_data() == found
+        assert passes == ['/', '/archive']
+
+        file['archive/scan_20/raw'].acquisitions = random_acquisitions(1)
+        assert 'archive/scan_20/raw' in file.find_data()
+        del file['archive/scan_0/raw'].acquisitions
+        assert 'archive/scan_0/raw' not in file.find_data()
+        del file['archive/scan_1']
+        assert 'archive/scan_1/recon/images' not in file.find_images()
+        assert len(passes) == 5
+
 def test_file_can_list_keys():
     filename = os.path.join(temp_dir, "keys.h5")
     with ismrmrd.File(filename) as file:
@@ -282,3 +642,192 @@ def test_file_can_read_and_write_headers():
         dataset = file['dataset']
         assert ismrmrd.xsd.ToXML(header) == ismrmrd.xsd.ToXML(dataset.header)
         assert header == dataset.header
+
+
+def test_file_parses_headers_once(monkeypatch):
+    filename = os.path.join(temp_dir, "file.h5")
+    header = create_example_ismrmrd_header()
+
+    parsed = []
+    parse = ismrmrd.file.CreateFromDocument
+    monkeypatch.setattr(ismrmrd.file, 'CreateFromDocument', lambda xml: parsed.append(xml) or parse(xml))
+
+    with ismrmrd.File(filename) as file:
+        file['dataset'].header = header
+        file['other'].header = header
+        for _ in range(10):
+            assert file['dataset'].header.encoding[0].encodedSpace.matrixSize.x == 64
+            assert file['other'].header == header
+        assert len(parsed) == 2
+
+        modified = file['dataset'].header
+        modified.encoding[0].encodedSpace.matrixSize.x = 32
+        assert file['dataset'].header.encoding[0].encodedSpace.matrixSize.x == 64
+        assert file['dataset'].header is not file['dataset'].header
+        assert len(parsed) == 2
+
+        changed = create_example_ismrmrd_header()
+        changed.encoding[0].encodedSpace.matrixSize.x = 128
+        file['dataset'].header = changed
+        assert file['dataset'].header.encoding[0].encodedSpace.matrixSize.x == 128
+        assert len(parsed) == 3
+
+        del file['dataset'].header
+        assert file['dataset'].header is None
+        del file['other']
+        assert file['other'].header is None
+        file['other'].header = header
+        assert file['other'].header == header
+        assert len(parsed) == 4
+
+    with ismrmrd.File(filename) as file:
+        assert file['other'].header == header
+        assert len(parsed) == 5
+
+
+def test_file_finds_acquisitions_by_encoding_counters():
+    filename = os.path.join(temp_dir, "encoding_index.h5")
+    acquisitions = list(random_acquisitions(12))
+    for i, acquisition in enumerate(acquisitions):
+        acquisition.idx.slice = i % 3
+        acquisition.idx.contrast = i // 6
+
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            file['dataset'].acquisitions = acquisitions
+            assert list(file['dataset'].acquisitions.find(slice=2)) == [2, 5, 8, 11]
+            file['dataset'].acquisitions.encoding_index(persist=True)
+
+        with ismrmrd.File(filename, 'r') as file:
+            read_acquisitions = file['dataset'].acquisitions
+            assert 'encoding_index' in file['dataset'].keys()
+            assert list(read_acquisitions.find(slice=2, contrast=1)) == [8, 11]
+
+        with ismrmrd.File(filename) as file:
+            file['dataset'].acquisitions[8] = acquisitions[0]
+            assert 'encoding_index' not in file['dataset'].keys()
+            assert list(file['dataset'].acquisitions.find(slice=2, contrast=1)) == [11]
+
+
+def test_file_selects_acquisitions_by_flags():
+    filename = os.path.join(temp_dir, "select_flags.h5")
+    acquisitions = list(random_acquisitions(6))
+    for acquisition in acquisitions:
+        acquisition.clear_all_flags()
+    acquisitions[0].set_flag(ismrmrd.ACQ_IS_NOISE_MEASUREMENT)
+    acquisitions[4].set_flag(ismrmrd.ACQ_IS_NAVIGATION_DATA)
+
+    for layout in ['vlen', 'dense']:
+        with ismrmrd.File(filename, 'w', layout=layout) as file:
+            file['dataset'].acquisitions = acquisitions
+
+            selection = file['dataset'].acquisitions.select(
+                flags_none=[ismrmrd.ACQ_IS_NOISE_MEASUREMENT, ismrmrd.ACQ_IS_NAVIGATION_DATA])
+            assert list(selection) == [1, 2, 3, 5]
+
+            selection = file['dataset'].acquisitions.select(flags_all=[ismrmrd.ACQ_IS_NAVIGATION_DATA], decode=True)
+            selected = list(selection)
+            assert len(selected) == 1
+            compare_acquisitions(acquisitions[4], selected[0])
+
+
+def test_file_supports_drivers_and_file_objects():
+    acquisitions = list(random_acquisitions(8))
+    images = list(random_images(2))
+
+    def write(file):
+        file['dataset'].acquisitions = acquisitions
+        file['dataset/images'].images = images
+
+    def check(file):
+        assert list(file['dataset'].acquisitions) == acquisitions
+        assert list(file['dataset/images'].images) == images
+
+    buffer = io.BytesIO()
+    with ismrmrd.File(buffer, 'w') as file:
+        write(file)
+    assert buffer.getvalue().startswith(b'\x89HDF')
+    with ismrmrd.File(buffer, 'r') as file:
+        check(file)
+
+    filename = os.path.join(temp_dir, "memory.h5")
+    with ismrmrd.File(filename, 'w', driver='core', backing_store=False) as file:
+        write(file)
+        check(file)
+    assert not os.path.exists(filename)
+    with ismrmrd.File(filename, 'w', driver='core', backing_store=True) as file:
+        write(file)
+    with ismrmrd.File(filename, 'r', driver='core') as file:
+        check(file)
+
+    filename = os.path.join(temp_dir, "paged.h5")
+    with ismrmrd.File(filename, driver='sec2', page_buf_size=1 << 20, page_size=1 << 14,
+                      alignment=(1 << 16, 1 << 12)) as file:
+        write(file)
+    with h5py.File(filename, 'r') as file:
+        assert file.driver == 'sec2'
+        assert file['dataset/images/data'].id.get_chunk_info(0).byte_offset % (1 << 12) == 0
+        assert file.id.get_create_plist().get_file_space_strategy()[0] == h5py.h5f.FSPACE_STRATEGY_PAGE
+    with ismrmrd.File(filename, 'r', page_buf_size=1 << 20) as file:
+        check(file)
+
+    with pytest.raises(ValueError):
+        ismrmrd.File(filename, 'r', backing_store=False)
+    with pytest.raises(ValueError):
+        ismrmrd.File(filename, 'r', swmr=True, driver='stdio')
+
+def test_file_swmr_reader_follows_writer():
+    filename = os.path.join(temp_dir, "swmr.h5")
+    acquisitions = list(random_acquisitions(8))
+
+    with ismrmrd.File(filename, 'w', swmr=True) as writer:
+        writer['dataset'].acquisitions = acquisitions[:3]
+        writer.start_swmr_write()
+        writer.flush()
+
+        with ismrmrd.File(filename, 'r', swmr=True) as reader:
+            read_acquisitions = reader['dataset'].acquisitions
+            assert len(read_acquisitions) == 3
+
+            writer['dataset'].acquisitions.extend(acquisitions[3:])
+            writer.flush()
+
+            reader.refresh()
+            assert len(read_acquisitions) == len(acquisitions)
+            for a, b in zip(acquisitions, read_acquisitions):
+                compare_acquisitions(a, b)
+
+
+def test_file_io_instrumentation():
+    filename = os.path.join(temp_dir, "instrumentation.h5")
+    acquisitions = list(random_acquisitions(5))
+    images = list(random_images(2))
+
+    with ismrmrd.File(filename, 'w') as file:
+        file['dataset'].acquisitions = acquisitions
+        stats = file.instrument()
+
+        file['dataset'].header = create_example_ismrmrd_header()
+        file['dataset'].header
+        file['dataset'].acquisitions.extend(acquisitions[:2])
+        file['images'].images = images
+        file['images'].images[0]
+
+        with file.collect_stats() as scoped:
+            for _ in file['dataset'].acquisitions:
+                pass
+        assert scoped.summary()['read_acquisition']['count'] == 7
+
+        summary = file.stats()
+        assert summary == stats.summary()
+        assert summary['write_header']['count'] == summary['read_header']['count'] == 1
+        assert summary['write_header']['bytes'] == summary['read_header']['bytes'] > 0
+        assert summary['append_acquisition']['count'] == 1
+        assert summary['append_acquisition']['bytes'] * 7 == summary['read_acquisition']['bytes'] * 2
+        assert summary['write_image']['count'] == summary['read_image']['count'] == 1
+        assert summary['write_image']['bytes'] >= sum(image.data.nbytes for image in images)
+        assert 'write_acquisition' not in summary
+
+        file.instrument(False)
+        file['dataset'].acquisitions[0]
+        assert file.stats() == {}
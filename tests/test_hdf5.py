@@ -1,5 +1,6 @@
 import ismrmrd
 import pytest
+import h5py
 
 import random
 import numpy.random
@@ -59,6 +60,95 @@ def test_read_and_write_acquisitions_to_hdf5():
         compare_acquisitions(acq_a, acq_b)
 
 
+def test_append_acquisitions_in_batches_to_hdf5():
+    filename = os.path.join(temp_dir, 'append_acquisitions.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 64)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisition(acquisitions[0])
+    dataset.append_acquisitions(acquisitions[1:40])
+    dataset.append_acquisitions(iter(acquisitions[40:]))
+    dataset.append_acquisitions([])
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename)
+    assert dataset.number_of_acquisitions() == len(acquisitions)
+
+    for i, acquisition in enumerate(acquisitions):
+        compare_acquisitions(acquisition, dataset.read_acquisition(i))
+
+
+def test_read_acquisitions_by_selection_from_hdf5():
+    filename = os.path.join(temp_dir, 'read_acquisitions.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 32)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisitions(acquisitions)
+
+    mask = numpy.zeros(len(acquisitions), dtype=bool)
+    mask[[1, 5, 30]] = True
+
+    selections = [
+        (None, list(range(32))),
+        (slice(4, 20, 3), list(range(4, 20, 3))),
+        (slice(None, None, -5), list(range(31, -1, -5))),
+        ([7, 2, 2, -1], [7, 2, 2, 31]),
+        (mask, [1, 5, 30]),
+        ([], []),
+    ]
+
+    for selection, expected in selections:
+        read_acquisitions = dataset.read_acquisitions(selection)
+        assert len(read_acquisitions) == len(expected)
+        for i, acquisition in zip(expected, read_acquisitions):
+            compare_acquisitions(acquisitions[i], acquisition)
+
+    with pytest.raises(IndexError):
+        dataset.read_acquisitions([32])
+
+
+def test_read_acquisitions_as_batch_from_hdf5():
+    filename = os.path.join(temp_dir, 'read_acquisitions_batch.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 8)]
+    ragged = ismrmrd.Acquisition.from_array(create_random_data((4, 64)))
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisitions(acquisitions + [ragged])
+
+    batch = dataset.read_acquisitions(slice(0, 8), batch=True)
+    assert not batch.is_ragged
+    assert batch.data.shape == (8, 32, 256)
+    assert batch.traj.shape == (8, 256, 2)
+    for acquisition, read_acquisition in zip(acquisitions, batch):
+        compare_acquisitions(acquisition, read_acquisition)
+
+    batch = dataset.read_acquisitions([8, 0], batch=True)
+    assert batch.is_ragged
+    compare_acquisitions(ragged, batch[0])
+    compare_acquisitions(acquisitions[0], batch[1])
+
+
+def test_read_acquisition_headers_from_hdf5():
+    filename = os.path.join(temp_dir, 'read_acquisition_headers.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 16)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisitions(acquisitions)
+
+    headers = dataset.read_acquisition_headers()
+    assert headers.dtype == ismrmrd.hdf5.acquisition_header_dtype
+    assert headers.shape == (16,)
+    for acquisition, header in zip(acquisitions, headers):
+        assert ismrmrd.AcquisitionHeader.from_buffer_copy(header) == acquisition.getHead()
+
+    headers = dataset.read_acquisition_headers([3, 1])
+    assert list(headers['scan_counter']) == [acquisitions[3].scan_counter, acquisitions[1].scan_counter]
+
+
 def test_read_and_write_images_to_hdf5():
     filename = os.path.join(temp_dir, 'read_write_images.h5')
 
@@ -80,6 +170,61 @@ def test_read_and_write_images_to_hdf5():
         compare_images(img_a, img_b)
 
 
+def test_append_images_and_arrays_after_reopening_hdf5():
+    filename = os.path.join(temp_dir, 'reopen_images.h5')
+
+    images = [create_random_image(seed) for seed in range(0, 4)]
+    arrays = [create_random_ndarray() for _ in range(0, 4)]
+
+    for first in range(0, 4, 2):
+        dataset = ismrmrd.Dataset(filename)
+        for image, array in zip(images[first:first + 2], arrays[first:first + 2]):
+            dataset.append_image('images', image)
+            dataset.append_array('arrays', array)
+        dataset.close()
+
+    dataset = ismrmrd.Dataset(filename, mode='r')
+    assert dataset.number_of_images('images') == len(images)
+    for i, image in enumerate(images):
+        compare_images(image, dataset.read_image('images', i))
+        assert np.array_equal(arrays[i], dataset.read_array('arrays', i))
+    dataset.close()
+
+
+def test_read_complex_images_and_arrays_from_threads():
+    from concurrent.futures import ThreadPoolExecutor
+
+    filename = os.path.join(temp_dir, 'read_complex_threads.h5')
+
+    images = [ismrmrd.Image.from_array(create_random_data((4, 16))) for _ in range(8)]
+    arrays = [create_random_data((3, 5)).astype(np.complex128) for _ in range(8)]
+
+    dataset = ismrmrd.Dataset(filename)
+    for image, array in zip(images, arrays):
+        dataset.append_image('images', image)
+        dataset.append_array('arrays', array)
+    dataset.close()
+
+    complex_names = h5py.get_config().complex_names
+
+    dataset = ismrmrd.Dataset(filename, create_if_needed=False)
+
+    def read(i):
+        return dataset.read_image('images', i % 8), dataset.read_array('arrays', i % 8)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(read, range(64)))
+    dataset.close()
+
+    assert h5py.get_config().complex_names == complex_names
+
+    for i, (image, array) in enumerate(results):
+        assert image.data.dtype == np.complex64
+        assert np.array_equal(image.data, images[i % 8].data)
+        assert array.dtype == np.complex128
+        assert np.array_equal(array, arrays[i % 8])
+
+
 def test_read_and_write_waveforms_to_hdf5():
     filename = os.path.join(temp_dir, 'read_write_waveforms.h5')
 
@@ -101,6 +246,630 @@ def test_read_and_write_waveforms_to_hdf5():
         compare_waveforms(wav_a, wav_b)
 
 
+def test_read_and_write_waveforms_in_batches():
+    filename = os.path.join(temp_dir, 'waveform_batches.h5')
+
+    waveforms = [create_random_waveform(seed) for seed in range(0, 16)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_waveforms(waveforms[:10])
+    dataset.append_waveforms(iter(waveforms[10:]))
+    dataset.append_waveforms([])
+
+    assert dataset.number_of_waveforms() == len(waveforms)
+    for waveform, read_waveform in zip(waveforms, dataset.read_waveforms()):
+        compare_waveforms(waveform, read_waveform)
+    for i, read_waveform in zip([5, 2, -1], dataset.read_waveforms([5, 2, -1])):
+        compare_waveforms(waveforms[i], read_waveform)
+    compare_waveforms(waveforms[-1], dataset.read_waveform(-1))
+    dataset.close()
+
+
+def test_waveforms_by_id():
+    filename = os.path.join(temp_dir, 'waveforms_by_id.h5')
+
+    ecg = [ismrmrd.Waveform.from_array(numpy.full((2, 4 + i), i, dtype=np.uint32),
+                                       waveform_id=0, time_stamp=10 * i, sample_time_us=500.0)
+           for i in range(0, 3)]
+    respiratory = [ismrmrd.Waveform.from_array(numpy.arange(8, dtype=np.uint32).reshape((1, 8)),
+                                               waveform_id=2, time_stamp=i, sample_time_us=1000.0)
+                   for i in range(0, 2)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_waveforms([ecg[0], respiratory[0], ecg[1], ecg[2], respiratory[1]])
+
+    samples, time_stamps = dataset.waveforms_by_id(0, tick_us=100.0)
+    assert samples.shape == (2, 15)
+    assert np.array_equal(samples, np.concatenate([w.data for w in ecg], axis=1))
+    assert list(time_stamps[:6]) == [0.0, 500.0, 1000.0, 1500.0, 1000.0, 1500.0]
+    assert time_stamps[-1] == 2000.0 + 5 * 500.0
+
+    samples, time_stamps = dataset.waveforms_by_id(2, 2500.0)
+    assert samples.shape == (1, 16)
+    assert time_stamps[8] == 2500.0
+
+    with pytest.raises(TypeError):
+        dataset.waveforms_by_id(2)
+
+    samples, time_stamps = dataset.waveforms_by_id(7, 2500.0)
+    assert samples.size == 0 and time_stamps.size == 0
+    dataset.close()
+
+
+def test_hdf5_io_instrumentation():
+    filename = os.path.join(temp_dir, 'instrumentation.h5')
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 6)]
+    image = create_random_image()
+
+    calls = []
+    dataset = ismrmrd.Dataset(filename, instrument=lambda *call: calls.append(call))
+    dataset.append_acquisitions(iter(acquisitions))
+    dataset.append_acquisition(acquisitions[0])
+    dataset.append_image('images', image)
+    dataset.read_image('images', 0)
+    for _ in range(0, 3):
+        dataset.read_acquisition(2)
+
+    stats = dataset.stats()
+    assert stats['append_acquisition']['count'] == 2
+    nbytes = sum(a.data.nbytes + a.traj.nbytes + ctypes.sizeof(ismrmrd.AcquisitionHeader) for a in acquisitions)
+    assert stats['append_acquisition']['bytes'] == nbytes + stats['read_acquisition']['bytes'] // 3
+    assert stats['read_acquisition']['count'] == 3
+    assert stats['append_image']['count'] == stats['read_image']['count'] == 1
+    assert stats['read_image']['bytes'] >= image.data.nbytes
+    for key in ('count', 'bytes', 'time', 'mean', 'p50', 'p90', 'p99', 'max'):
+        assert key in stats['read_acquisition']
+    assert 0 <= stats['read_acquisition']['p50'] <= stats['read_acquisition']['max']
+    assert [call[0] for call in calls] == ['append_acquisition'] * 2 + ['append_image', 'read_image'] + \
+                                          ['read_acquisition'] * 3
+
+    with dataset.collect_stats() as scoped:
+        list(dataset.read_acquisitions())
+    assert scoped.summary()['read_acquisition']['count'] == 1
+    assert scoped.summary()['read_acquisition']['bytes'] == nbytes + stats['read_acquisition']['bytes'] // 3
+    assert dataset.stats()['read_acquisition']['count'] == 4
+
+    dataset.instrument(False)
+    dataset.read_acquisition(0)
+    assert dataset.stats() == {}
+    assert len(calls) == 8
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.read_acquisition(0)
+    assert dataset.stats() == {}
+    dataset.close()
+
+
+def test_hdf5_storage_options():
+    filename = os.path.join(temp_dir, 'storage_options.h5')
+
+    storage = {'chunks': 16, 'compression': 'gzip', 'shuffle': True, 'fletcher32': True}
+
+    dataset = ismrmrd.Dataset(filename, storage=storage)
+    dataset.append_acquisitions([create_random_acquisition(seed) for seed in range(0, 4)])
+    dataset.append_image('images', create_random_image())
+    dataset.append_array('arrays', create_random_ndarray(), storage={'compression': 'lzf'})
+    dataset.close()
+
+    with h5py.File(filename, 'r') as file:
+        data = file['dataset/data']
+        assert data.chunks == (16,)
+        assert data.compression == 'gzip'
+        assert data.shuffle and data.fletcher32
+
+        images = file['dataset/images/data']
+        assert images.chunks == (16, 1, 1, 256, 256)
+        assert images.compression == 'gzip'
+
+        arrays = file['dataset/arrays']
+        assert arrays.compression == 'lzf'
+        assert not arrays.fletcher32
+
+    with pytest.raises(TypeError):
+        ismrmrd.Dataset(filename, storage={'chunk': 16})
+
+    with pytest.raises(ValueError):
+        ismrmrd.Dataset(filename, storage={'compression': 'zstd'})
+
+
+def test_hdf5_appends_grow_geometrically_and_trim_on_close():
+    filename = os.path.join(temp_dir, 'growth.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 10)]
+    waveforms = [create_random_waveform(seed) for seed in range(0, 3)]
+
+    dataset = ismrmrd.Dataset(filename)
+    for acquisition in acquisitions:
+        dataset.append_acquisition(acquisition)
+    for waveform in waveforms:
+        dataset.append_waveform(waveform)
+
+    data = dataset._dataset['data']
+    assert data.shape[0] > len(acquisitions)
+    assert data.attrs['ismrmrd_length'] == len(acquisitions)
+
+    assert dataset.number_of_acquisitions() == len(acquisitions)
+    assert dataset.number_of_waveforms() == len(waveforms)
+    assert len(dataset.read_acquisitions()) == len(acquisitions)
+    compare_acquisitions(acquisitions[-1], dataset.read_acquisition(-1))
+    with pytest.raises(IndexError):
+        dataset.read_acquisition(len(acquisitions))
+
+    # indices refer to the acquisitions in use, not to the spare rows
+    dataset.write_acquisition(acquisitions[0], -1)
+    compare_acquisitions(acquisitions[0], dataset.read_acquisition(len(acquisitions) - 1))
+    with pytest.raises(IndexError):
+        dataset.write_acquisition(acquisitions[0], len(acquisitions))
+    with pytest.raises(IndexError):
+        dataset.write_acquisition(acquisitions[0], -len(acquisitions) - 1)
+    dataset.write_acquisition(acquisitions[-1], -1)
+
+    dataset.flush()
+    assert data.shape[0] == len(acquisitions)
+    assert 'ismrmrd_length' not in data.attrs
+
+    dataset.append_acquisition(acquisitions[0])
+    dataset.close()
+
+    with h5py.File(filename, 'r') as file:
+        assert file['dataset/data'].shape == (len(acquisitions) + 1,)
+        assert file['dataset/waveforms'].shape == (len(waveforms),)
+        assert 'ismrmrd_length' not in file['dataset/data'].attrs
+
+
+def test_hdf5_appends_without_growth():
+    filename = os.path.join(temp_dir, 'no_growth.h5')
+
+    dataset = ismrmrd.Dataset(filename, growth_factor=None)
+    for seed in range(0, 4):
+        dataset.append_acquisition(create_random_acquisition(seed))
+        assert dataset._dataset['data'].shape == (seed + 1,)
+        assert 'ismrmrd_length' not in dataset._dataset['data'].attrs
+    dataset.close()
+
+
+def test_hdf5_caches_handles_and_chunk_cache_settings():
+    filename = os.path.join(temp_dir, 'handles.h5')
+
+    dataset = ismrmrd.Dataset(filename, rdcc_nbytes=16 * 1024 * 1024, rdcc_nslots=10007)
+    with pytest.raises(LookupError):
+        dataset.number_of_acquisitions()
+
+    dataset.append_acquisition(create_random_acquisition(0))
+    handle = dataset._lookup('data')
+    dataset.append_acquisition(create_random_acquisition(1))
+    assert dataset._lookup('data') is handle
+    assert dataset.number_of_acquisitions() == 2
+
+    assert dataset._file.id.get_access_plist().get_cache()[2] == 16 * 1024 * 1024
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename, mode='r')
+    compare_acquisitions(create_random_acquisition(1), dataset.read_acquisition(1))
+    dataset.close()
+
+
+def test_hdf5_dense_acquisition_layout():
+    filename = os.path.join(temp_dir, 'dense.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 16)]
+
+    dataset = ismrmrd.Dataset(filename, layout='dense', storage={'compression': 'gzip'})
+    dataset.append_acquisitions(acquisitions[:10])
+    for acquisition in acquisitions[10:]:
+        dataset.append_acquisition(acquisition)
+    dataset.close()
+
+    with h5py.File(filename, 'r') as file:
+        assert 'data' not in file['dataset']
+        assert file['dataset/dense_data'].shape == (16, 32, 256)
+        assert file['dataset/dense_data'].compression == 'gzip'
+        assert file['dataset/dense_traj'].shape == (16, 256, 2)
+
+    dataset = ismrmrd.Dataset(filename)
+    assert dataset.number_of_acquisitions() == len(acquisitions)
+    compare_acquisitions(acquisitions[3], dataset.read_acquisition(3))
+    for i, acquisition in zip([5, 2, 2], dataset.read_acquisitions([5, 2, 2])):
+        compare_acquisitions(acquisitions[i], acquisition)
+
+    batch = dataset.read_acquisitions(batch=True)
+    assert batch.data.shape == (16, 32, 256)
+    assert list(dataset.read_acquisition_headers()['scan_counter']) == [a.scan_counter for a in acquisitions]
+
+    dataset.write_acquisition(acquisitions[0], 15)
+    compare_acquisitions(acquisitions[0], dataset.read_acquisition(15))
+    dataset.close()
+
+
+def test_hdf5_dense_layout_falls_back_to_vlen():
+    filename = os.path.join(temp_dir, 'dense_fallback.h5')
+
+    acquisitions = [ismrmrd.Acquisition.from_array(create_random_data((4, 64))) for _ in range(0, 6)]
+    acquisitions.append(ismrmrd.Acquisition.from_array(create_random_data((4, 32))))
+
+    dataset = ismrmrd.Dataset(filename, layout='dense')
+    dataset.append_acquisitions(acquisitions[:6])
+    assert 'dense_data' in dataset.list()
+    assert 'dense_traj' not in dataset.list()
+    compare_acquisitions(acquisitions[0], dataset.read_acquisition(0))
+
+    dataset.append_acquisitions(acquisitions[6:])
+    assert 'dense_data' not in dataset.list()
+    dataset.append_acquisition(acquisitions[0])
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename)
+    assert dataset.number_of_acquisitions() == len(acquisitions) + 1
+    for acquisition, read_acquisition in zip(acquisitions + acquisitions[:1], dataset.read_acquisitions()):
+        compare_acquisitions(acquisition, read_acquisition)
+    dataset.close()
+
+
+def test_hdf5_background_writes():
+    filename = os.path.join(temp_dir, 'background_writes.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 32)]
+    waveforms = [create_random_waveform(seed) for seed in range(0, 8)]
+
+    dataset = ismrmrd.Dataset(filename, background_writes=True, queue_size=4)
+    for i, acquisition in enumerate(acquisitions):
+        dataset.append_acquisition(acquisition)
+        if i % 4 == 0:
+            dataset.append_waveform(waveforms[i // 4])
+    dataset.append_acquisitions([])
+
+    # reads wait for the queued appends
+    assert dataset.number_of_acquisitions() == len(acquisitions)
+    assert dataset.number_of_waveforms() == len(waveforms)
+
+    dataset.append_acquisitions(acquisitions)
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename)
+    assert dataset.number_of_acquisitions() == 2 * len(acquisitions)
+    for i, acquisition in enumerate(acquisitions + acquisitions):
+        compare_acquisitions(acquisition, dataset.read_acquisition(i))
+    for i, waveform in enumerate(waveforms):
+        compare_waveforms(waveform, dataset.read_waveform(i))
+
+
+def test_hdf5_background_writes_block_when_queue_is_full():
+    import threading
+
+    filename = os.path.join(temp_dir, 'background_backpressure.h5')
+
+    dataset = ismrmrd.Dataset(filename, background_writes=True, queue_size=1)
+
+    writing, release = threading.Event(), threading.Event()
+    append = dataset._append_acquisitions
+
+    def slow_append(acquisitions, storage):
+        writing.set()
+        release.wait()
+        append(acquisitions, storage)
+
+    dataset._append_acquisitions = slow_append
+
+    # one append is being written and one fills the queue
+    dataset.append_acquisition(create_random_acquisition(0))
+    writing.wait()
+    dataset.append_acquisition(create_random_acquisition(1))
+
+    producer = threading.Thread(target=dataset.append_acquisition, args=(create_random_acquisition(2),))
+    producer.start()
+    producer.join(timeout=0.2)
+    assert producer.is_alive()
+
+    release.set()
+    producer.join()
+    dataset.flush()
+    assert dataset.number_of_acquisitions() == 3
+    dataset.close()
+
+
+def test_hdf5_background_write_errors_are_raised():
+    filename = os.path.join(temp_dir, 'background_errors.h5')
+
+    dataset = ismrmrd.Dataset(filename, background_writes=True)
+    dataset.append_acquisition(create_random_acquisition(), storage={'compression': 'zstd'})
+
+    with pytest.raises(ValueError):
+        dataset.flush()
+    with pytest.raises(ValueError):
+        dataset.append_acquisition(create_random_acquisition())
+    with pytest.raises(ValueError):
+        dataset.close()
+
+    dataset.close()
+
+
+def test_hdf5_background_writes_keep_appends_before_a_bad_one():
+    filename = os.path.join(temp_dir, 'background_bad_append.h5')
+
+    for layout in ['vlen', 'dense']:
+        acquisitions = [create_random_acquisition(seed) for seed in range(0, 3)]
+        expected = [ismrmrd.Acquisition.from_bytes(acquisition.to_bytes()) for acquisition in acquisitions]
+        waveform = create_random_waveform()
+        expected_waveform = ismrmrd.Waveform.from_bytes(waveform.to_bytes())
+
+        dataset = ismrmrd.Dataset(filename, mode='w', layout=layout, background_writes=True)
+        dataset.append_acquisitions(acquisitions)
+        dataset.append_waveform(waveform)
+
+        # the bad append raises in the call that passed it
+        with pytest.raises(AttributeError):
+            dataset.append_acquisition(object())
+        with pytest.raises(AttributeError):
+            dataset.append_waveform(object())
+
+        # the queued appends are snapshots of the objects
+        acquisitions[0].data[:] = 0
+        waveform.data[:] = 0
+
+        dataset.append_acquisition(acquisitions[1])
+        dataset.close()
+
+        dataset = ismrmrd.Dataset(filename)
+        assert dataset.number_of_acquisitions() == 4
+        for i, acquisition in enumerate(expected + expected[1:2]):
+            compare_acquisitions(acquisition, dataset.read_acquisition(i))
+        compare_waveforms(expected_waveform, dataset.read_waveform(0))
+        dataset.close()
+
+
+def test_hdf5_swmr_reader_follows_writer():
+    filename = os.path.join(temp_dir, 'swmr.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 12)]
+    waveforms = [create_random_waveform(seed) for seed in range(0, 2)]
+
+    writer = ismrmrd.Dataset(filename, swmr=True)
+    writer.write_xml_header(b'<ismrmrdHeader/>')
+    writer.append_acquisitions(acquisitions[:4])
+    writer.append_waveform(waveforms[0])
+
+    reader = ismrmrd.Dataset(filename, mode='r', swmr=True)
+    assert reader.number_of_acquisitions() == 4
+    assert reader.number_of_waveforms() == 1
+
+    for acquisition in acquisitions[4:]:
+        writer.append_acquisition(acquisition)
+    writer.append_waveform(waveforms[1])
+    assert 'ismrmrd_length' not in writer._dataset['data'].attrs
+
+    reader.refresh()
+    assert reader.number_of_acquisitions() == len(acquisitions)
+    assert reader.number_of_waveforms() == len(waveforms)
+    for i, acquisition in enumerate(acquisitions):
+        compare_acquisitions(acquisition, reader.read_acquisition(i))
+    compare_waveforms(waveforms[1], reader.read_waveform(1))
+    assert reader.read_xml_header() == b'<ismrmrdHeader/>'
+
+    reader.close()
+    writer.close()
+
+    with pytest.raises(ValueError):
+        ismrmrd.Dataset(filename, swmr=True, layout='dense')
+
+
+def test_hdf5_encoding_index():
+    filename = os.path.join(temp_dir, 'encoding_index.h5')
+
+    acquisitions = []
+    for i in range(0, 24):
+        acquisition = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+        acquisition.idx.kspace_encode_step_1 = i % 4
+        acquisition.idx.slice = (i // 4) % 3
+        acquisition.idx.repetition = i // 12
+        acquisition.idx.user[0] = i % 2
+        acquisitions.append(acquisition)
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisitions(acquisitions[:12])
+
+    assert list(dataset.find_acquisitions(slice=1)) == [4, 5, 6, 7]
+
+    dataset.append_acquisitions(acquisitions[12:])
+    assert list(dataset.find_acquisitions(slice=1)) == [4, 5, 6, 7, 16, 17, 18, 19]
+    assert list(dataset.find_acquisitions(slice=2, repetition=1, kspace_encode_step_1=3)) == [23]
+    assert list(dataset.find_acquisitions(slice=5)) == []
+    assert len(dataset.find_acquisitions()) == 24
+
+    index = dataset.encoding_index(persist=True)
+    assert len(index.groups('slice', 'repetition')) == 6
+    assert list(index.rows(user=[1, 0, 0, 0, 0, 0, 0, 0], slice=0)) == [1, 3, 13, 15]
+
+    with pytest.raises(TypeError):
+        dataset.find_acquisitions(slices=1)
+
+    for i, acquisition in zip(dataset.find_acquisitions(repetition=1, slice=0),
+                              dataset.read_acquisitions(dataset.find_acquisitions(repetition=1, slice=0))):
+        compare_acquisitions(acquisitions[i], acquisition)
+    dataset.close()
+
+    dataset = ismrmrd.Dataset(filename)
+    assert 'encoding_index' in dataset.list()
+    assert list(dataset.find_acquisitions(slice=1, repetition=0)) == [4, 5, 6, 7]
+
+    acquisitions[4].idx.slice = 2
+    dataset.write_acquisition(acquisitions[4], 4)
+    assert 'encoding_index' not in dataset.list()
+    assert list(dataset.find_acquisitions(slice=1, repetition=0)) == [5, 6, 7]
+    dataset.close()
+
+
+def test_hdf5_select_acquisitions_by_flags():
+    filename = os.path.join(temp_dir, 'select_flags.h5')
+
+    acquisitions = [ismrmrd.Acquisition.from_array(create_random_data((2, 16))) for _ in range(0, 10)]
+    for i in (0, 1):
+        acquisitions[i].set_flag(ismrmrd.ACQ_IS_NOISE_MEASUREMENT)
+    for i in (2, 5, 8):
+        acquisitions[i].set_flag(ismrmrd.ACQ_IS_PARALLEL_CALIBRATION)
+    acquisitions[5].set_flag(ismrmrd.ACQ_IS_PARALLEL_CALIBRATION_AND_IMAGING)
+    acquisitions[9].set_flag(ismrmrd.ACQ_LAST_IN_MEASUREMENT)
+
+    for layout in ['vlen', 'dense']:
+        dataset = ismrmrd.Dataset(filename, mode='w', layout=layout)
+        dataset.append_acquisitions(acquisitions)
+
+        assert list(dataset.select(flags_none=[ismrmrd.ACQ_IS_NOISE_MEASUREMENT])) == list(range(2, 10))
+        assert list(dataset.select(flags_all=ismrmrd.ACQ_IS_PARALLEL_CALIBRATION)) == [2, 5, 8]
+        assert list(dataset.select(flags_all=[ismrmrd.ACQ_IS_PARALLEL_CALIBRATION,
+                                              ismrmrd.ACQ_IS_PARALLEL_CALIBRATION_AND_IMAGING])) == [5]
+        assert list(dataset.select(flags_all=[ismrmrd.ACQ_IS_PARALLEL_CALIBRATION],
+                                   flags_none=[ismrmrd.ACQ_IS_PARALLEL_CALIBRATION_AND_IMAGING])) == [2, 8]
+        assert len(dataset.select()) == len(acquisitions)
+
+        selected = dataset.select(flags_none=[ismrmrd.ACQ_IS_NOISE_MEASUREMENT,
+                                              ismrmrd.ACQ_IS_PARALLEL_CALIBRATION], decode=True)
+        for i, acquisition in zip([3, 4, 6, 7, 9], selected):
+            compare_acquisitions(acquisitions[i], acquisition)
+        dataset.close()
+
+
+def test_hdf5_read_kspace():
+    filename = os.path.join(temp_dir, 'read_kspace.h5')
+
+    header = create_example_ismrmrd_header()
+    encoding = header.encoding[0]
+    encoding.encodedSpace.matrixSize = ismrmrd.xsd.matrixSizeType(x=16, y=12, z=1)
+    encoding.encodingLimits.kspace_encoding_step_1 = ismrmrd.xsd.limitType(minimum=0, maximum=7, center=4)
+    encoding.encodingLimits.kspace_encoding_step_2 = ismrmrd.xsd.limitType(minimum=0, maximum=0, center=0)
+    encoding.encodingLimits.slice = ismrmrd.xsd.limitType(minimum=0, maximum=2, center=0)
+    encoding.encodingLimits.contrast = ismrmrd.xsd.limitType(minimum=0, maximum=1, center=0)
+
+    # partial Fourier: 8 of 12 lines, centred on line 4
+    expected = numpy.zeros((2, 3, 4, 1, 12, 16), dtype=np.complex64)
+
+    noise = ismrmrd.Acquisition.from_array(create_random_data((4, 16)))
+    noise.set_flag(ismrmrd.ACQ_IS_NOISE_MEASUREMENT)
+    acquisitions = [noise]
+    for contrast in range(2):
+        for slice in range(3):
+            for line in range(8):
+                data = create_random_data((4, 16))
+                acquisition = ismrmrd.Acquisition.from_array(data)
+                acquisition.idx.contrast = contrast
+                acquisition.idx.slice = slice
+                acquisition.idx.kspace_encode_step_1 = line
+                acquisitions.append(acquisition)
+                expected[contrast, slice, :, 0, line + 2, :] = data
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.write_xml_header(ismrmrd.xsd.ToXML(header))
+    dataset.append_acquisitions(acquisitions)
+
+    for block_size in [1024, 5]:
+        kspace = dataset.read_kspace(block_size=block_size)
+        assert kspace.shape == (2, 3, 4, 1, 12, 16)
+        assert kspace.dtype == np.complex64
+        assert np.array_equal(kspace, expected)
+
+    kspace = dataset.read_kspace(dataset.find_acquisitions(slice=1, contrast=0))
+    assert np.array_equal(kspace[0, 1], expected[0, 1])
+    assert not kspace[1].any() and not kspace[0, 0].any()
+
+    dataset.append_acquisition(ismrmrd.Acquisition.from_array(create_random_data((2, 16))))
+    with pytest.raises(ValueError):
+        dataset.read_kspace()
+    dataset.close()
+
+
+def test_hdf5_read_kspace_rejects_lines_outside_of_the_matrix():
+    filename = os.path.join(temp_dir, 'read_kspace_range.h5')
+
+    header = create_example_ismrmrd_header()
+    encoding = header.encoding[0]
+    encoding.encodedSpace.matrixSize = ismrmrd.xsd.matrixSizeType(x=16, y=8, z=1)
+    encoding.encodingLimits.kspace_encoding_step_2 = ismrmrd.xsd.limitType(minimum=0, maximum=0, center=0)
+
+    acquisitions = []
+    for line in range(8):
+        acquisition = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+        acquisition.idx.kspace_encode_step_1 = line
+        acquisitions.append(acquisition)
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.write_xml_header(ismrmrd.xsd.ToXML(header))
+    dataset.append_acquisitions(acquisitions)
+
+    # centre beyond size // 2: the first lines would wrap to the end of k-space
+    encoding.encodingLimits.kspace_encoding_step_1 = ismrmrd.xsd.limitType(minimum=0, maximum=7, center=6)
+    with pytest.raises(ValueError):
+        dataset.read_kspace(header=header)
+
+    # centre below size // 2: the last lines would fall off the end
+    encoding.encodingLimits.kspace_encoding_step_1 = ismrmrd.xsd.limitType(minimum=0, maximum=7, center=2)
+    with pytest.raises(ValueError):
+        dataset.read_kspace(header=header)
+
+    encoding.encodingLimits.kspace_encoding_step_1 = ismrmrd.xsd.limitType(minimum=0, maximum=7, center=4)
+    kspace = dataset.read_kspace(header=header)
+    for line, acquisition in enumerate(acquisitions):
+        assert np.array_equal(kspace[0, 0, :, 0, line], acquisition.data)
+    dataset.close()
+
+
+def test_hdf5_read_kspace_rejects_counters_beyond_the_encoding_limits():
+    filename = os.path.join(temp_dir, 'read_kspace_limits.h5')
+
+    header = create_example_ismrmrd_header()
+    encoding = header.encoding[0]
+    encoding.encodedSpace.matrixSize = ismrmrd.xsd.matrixSizeType(x=16, y=4, z=1)
+    encoding.encodingLimits.kspace_encoding_step_1 = ismrmrd.xsd.limitType(minimum=0, maximum=3, center=2)
+    encoding.encodingLimits.kspace_encoding_step_2 = ismrmrd.xsd.limitType(minimum=0, maximum=0, center=0)
+    encoding.encodingLimits.contrast = ismrmrd.xsd.limitType(minimum=0, maximum=0, center=0)
+    encoding.encodingLimits.slice = None
+
+    acquisitions = []
+    for slice in range(2):
+        for contrast in range(2):
+            acquisition = ismrmrd.Acquisition.from_array(create_random_data((2, 16)))
+            acquisition.idx.slice = slice
+            acquisition.idx.contrast = contrast
+            acquisitions.append(acquisition)
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.write_xml_header(ismrmrd.xsd.ToXML(header))
+    dataset.append_acquisitions(acquisitions)
+
+    with pytest.raises(ValueError, match='contrast 1'):
+        dataset.read_kspace(dataset.find_acquisitions(slice=0))
+
+    # no slice limit: a single slice
+    with pytest.raises(ValueError, match='slice 1'):
+        dataset.read_kspace(dataset.find_acquisitions(contrast=0))
+
+    kspace = dataset.read_kspace(dataset.find_acquisitions(slice=0, contrast=0))
+    assert kspace.shape == (1, 1, 2, 1, 4, 16)
+    dataset.close()
+
+
+def count_samples(batch):
+    return len(batch), int(batch.headers['number_of_samples'].sum())
+
+
+def test_hdf5_map_acquisitions_in_worker_processes():
+    filename = os.path.join(temp_dir, 'map_acquisitions.h5')
+
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 20)]
+
+    dataset = ismrmrd.Dataset(filename)
+    dataset.append_acquisitions(acquisitions)
+
+    batches = list(dataset.map_acquisitions(processes=2, shard_size=6))
+    assert [len(batch) for batch in batches] == [6, 6, 6, 2]
+    for acquisition, read_acquisition in zip(acquisitions, (a for batch in batches for a in batch)):
+        compare_acquisitions(acquisition, read_acquisition)
+
+    results = list(dataset.map_acquisitions(count_samples, processes=2, shard_size=6, ordered=False))
+    assert sorted(results) == [(2, 512), (6, 1536), (6, 1536), (6, 1536)]
+
+    dataset.close()
+
+
 def test_waveform_hdf5_size():
     assert ismrmrd.hdf5.waveform_header_dtype.itemsize == 40
 
@@ -0,0 +1,95 @@
+import ismrmrd
+import ismrmrd.repack
+import h5py
+import shutil
+import os.path
+import tempfile
+import pytest
+from test_common import *
+
+
+@pytest.fixture(autouse=True)
+def temp_dir_fixture():
+    global temp_dir
+    temp_dir = tempfile.mkdtemp(prefix='ismrmrd-python-', suffix='-test')
+    yield
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def create_fragmented_file(filename):
+    acquisitions = [create_random_acquisition(seed) for seed in range(0, 24)]
+    waveforms = [create_random_waveform(seed) for seed in range(0, 5)]
+    images = [create_random_image(seed) for seed in range(0, 3)]
+    arrays = [create_random_ndarray() for _ in range(0, 2)]
+
+    dataset = ismrmrd.Dataset(filename, storage={'chunks': 1})
+    dataset.write_xml_header(ismrmrd.xsd.ToXML(create_example_ismrmrd_header()))
+    for acquisition in acquisitions:
+        dataset.append_acquisition(acquisition)
+    for waveform in waveforms:
+        dataset.append_waveform(waveform)
+    for image in images:
+        dataset.append_image('images', image)
+    for array in arrays:
+        dataset.append_array('arrays', array)
+    dataset._dataset.attrs['note'] = 'kept'
+    dataset.close()
+
+    return acquisitions, waveforms, images, arrays
+
+
+def test_repack_preserves_contents():
+    source = os.path.join(temp_dir, 'source.h5')
+    destination = os.path.join(temp_dir, 'destination.h5')
+
+    acquisitions, waveforms, images, arrays = create_fragmented_file(source)
+
+    report = ismrmrd.repack.repack(source, destination)
+    assert report['source_size'] == os.path.getsize(source)
+    assert report['destination_size'] == os.path.getsize(destination)
+    assert report['items'] == len(acquisitions) + len(waveforms) + len(images)
+    assert report['source_read_time'] > 0 and report['destination_read_time'] > 0
+
+    with h5py.File(destination, 'r') as file:
+        data = file['dataset/data']
+        assert data.compression == 'gzip' and data.shuffle
+        assert data.chunks[0] == len(acquisitions)
+        assert data.maxshape == (None,)
+        assert file['dataset'].attrs['note'] == 'kept'
+        assert 'ismrmrd_length' not in data.attrs
+
+    dataset = ismrmrd.Dataset(destination, mode='r')
+    assert dataset.read_xml_header() == ismrmrd.xsd.ToXML(create_example_ismrmrd_header()).encode()
+    for acquisition, read_acquisition in zip(acquisitions, dataset.read_acquisitions()):
+        compare_acquisitions(acquisition, read_acquisition)
+    for waveform, read_waveform in zip(waveforms, dataset.read_waveforms()):
+        compare_waveforms(waveform, read_waveform)
+    for i, image in enumerate(images):
+        compare_images(image, dataset.read_image('images', i))
+    for i, array in enumerate(arrays):
+        assert np.array_equal(array, dataset.read_array('arrays', i))
+    dataset.close()
+
+    with pytest.raises(FileExistsError):
+        ismrmrd.repack.repack(source, destination, measure=False)
+
+    ismrmrd.repack.repack(source, destination, storage={'compression': 'lzf'}, overwrite=True, measure=False)
+    with h5py.File(destination, 'r') as file:
+        assert file['dataset/data'].compression == 'lzf'
+
+
+def test_repack_command_line(capsys):
+    source = os.path.join(temp_dir, 'source.h5')
+    destination = os.path.join(temp_dir, 'destination.h5')
+
+    create_fragmented_file(source)
+
+    ismrmrd.repack.main([source, destination, '--compression', 'none', '--chunk-bytes', '4096'])
+
+    output = capsys.readouterr().out
+    assert 'MiB ->' in output
+    assert 'items/s' in output
+
+    with h5py.File(destination, 'r') as file:
+        assert file['dataset/data'].compression is None
+        assert file['dataset/data'].chunks[0] == 4096 // ismrmrd.hdf5.acquisition_dtype.itemsize